@@ -0,0 +1,93 @@
+import queue
+import threading
+import traceback
+
+POLICIES = ("block", "drop")
+_STOP = object()
+
+
+class AsyncWriter:
+    """
+    Run write calls on a dedicated thread, in submission order.
+
+    The queue holds at most max_queue pending calls. When it is full, the
+    "block" policy waits for room and the "drop" policy discards the call and
+    counts it in num_dropped. Exceptions raised by a call do not stop the
+    thread: the first one is raised again by the next submit, call, flush or
+    close, the later ones are printed.
+    """
+
+    def __init__(self, max_queue=1024, policy="block"):
+        if policy not in POLICIES:
+            raise ValueError(f"policy should be in {POLICIES}, got {policy}")
+        self.policy = policy
+        self.num_dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._closed = False
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, name="toolbox-async-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        """
+        Queue fn(*args); returns False if it was dropped.
+        """
+        if self._closed:
+            raise RuntimeError("AsyncWriter is closed")
+        self._raise_error()
+        if self.policy == "block":
+            self._queue.put((fn, args))
+            return True
+        try:
+            self._queue.put_nowait((fn, args))
+        except queue.Full:
+            self.num_dropped += 1
+            return False
+        return True
+
+    def call(self, fn, *args):
+        """
+        Queue fn(*args), waiting for room whatever the policy.
+        """
+        if self._closed:
+            raise RuntimeError("AsyncWriter is closed")
+        self._raise_error()
+        self._queue.put((fn, args))
+
+    def flush(self):
+        """
+        Wait until every queued call has run.
+        """
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                fn, args = item
+                fn(*args)
+            except Exception as e:
+                if self._error is None:
+                    self._error = e
+                else:
+                    traceback.print_exc()
+            finally:
+                self._queue.task_done()
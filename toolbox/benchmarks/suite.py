@@ -0,0 +1,460 @@
+"""
+Benchmarks of the hot paths of toolbox on synthetic experiment trees.
+
+    python -m toolbox.benchmarks.suite run --scale small -o before.json
+    python -m toolbox.benchmarks.suite run --scale small -o after.json
+    python -m toolbox.benchmarks.suite compare before.json after.json
+"""
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+import numpy as np
+import yaml
+
+from toolbox.benchmarks.synthetic import make_progress_file, make_tfevents_tree
+
+SCALES = {
+    "small": {"num_exps": 2, "num_seeds": 2, "num_tags": 4, "num_steps": 1000},
+    "medium": {"num_exps": 2, "num_seeds": 4, "num_tags": 8, "num_steps": 10000},
+    "large": {"num_exps": 4, "num_seeds": 4, "num_tags": 8, "num_steps": 100000},
+}
+# bytes of parameters saved by the checkpointing cases
+CHECKPOINT_SIZES = {"small": 1 << 20, "medium": 16 << 20, "large": 128 << 20}
+NUM_CHECKPOINTS = 5
+CASES = {}
+
+
+def case(name):
+    """
+    Register fn(data, work_dir) as the benchmark name. fn does the setup
+    and returns the function timed, called without arguments.
+    """
+
+    def register(fn):
+        CASES[name] = fn
+        return fn
+
+    return register
+
+
+class Data:
+    """
+    Synthetic tree of a scale, generated in root unless it already exists.
+    """
+
+    def __init__(self, root, scale):
+        self.scale = scale
+        self.params = SCALES[scale]
+        self.root = os.path.join(root, scale)
+        config_path = os.path.join(self.root, "config.yml")
+        self.paths = [
+            os.path.join(self.root, f"exp{i}") for i in range(self.params["num_exps"])
+        ]
+        self.tags = [f"train/tag{k}" for k in range(self.params["num_tags"])]
+        self.progress_file = os.path.join(self.root, "progress", "progress.yml")
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                if yaml.safe_load(f) == self.params:
+                    return
+        shutil.rmtree(self.root, ignore_errors=True)
+        make_tfevents_tree(self.root, **self.params)
+        make_progress_file(
+            self.progress_file,
+            num_rows=self.params["num_steps"],
+            num_keys=self.params["num_tags"],
+        )
+        with open(config_path, "w") as f:
+            yaml.dump(self.params, f)
+
+    @property
+    def log_keys(self):
+        return self.tags + ["trainer/epoch"]
+
+    def load(self):
+        from toolbox.logs_util import read_tensorboard
+
+        return read_tensorboard(self.paths, self.log_keys, num_scalars=1000)
+
+
+@case("loading/accumulator")
+def bench_load_accumulator(data, work_dir):
+    from toolbox.logs_util import read_tensorboard
+
+    return lambda: read_tensorboard(
+        data.paths, data.log_keys, reader="accumulator", num_scalars=1000
+    )
+
+
+@case("loading/native")
+def bench_load_native(data, work_dir):
+    from toolbox.logs_util import read_tensorboard
+
+    return lambda: read_tensorboard(
+        data.paths, data.log_keys, reader="native", num_scalars=1000
+    )
+
+
+@case("loading/progress_yml")
+def bench_load_progress(data, work_dir):
+    from toolbox.logs_util import read_progress_logs
+
+    keys = [f"train/key{k}" for k in range(data.params["num_tags"])]
+    return lambda: read_progress_logs([os.path.dirname(data.progress_file)], keys)
+
+
+@case("aggregation/mean")
+def bench_aggregate_mean(data, work_dir):
+    from toolbox.logs_util import aggregate_logs
+
+    logs = data.load()
+    return lambda: [aggregate_logs(runs, "/seed") for runs in logs.values()]
+
+
+@case("aggregation/bootstrap")
+def bench_aggregate_bootstrap(data, work_dir):
+    from toolbox.logs_util import aggregate_logs
+
+    logs = data.load()
+    return lambda: [
+        aggregate_logs(runs, "/seed", band="bootstrap") for runs in logs.values()
+    ]
+
+
+def _bench_smoothing(kernel, weight):
+    def bench(data, work_dir):
+        from toolbox.smoothing import smooth
+
+        values = np.random.default_rng(0).standard_normal(
+            (data.params["num_steps"] * data.params["num_seeds"], 3)
+        )
+        return lambda: smooth(values, weight, kernel)
+
+    return bench
+
+
+for _kernel, _weight in (("ema", 0.9), ("window", 100), ("gaussian", 50)):
+    case(f"smoothing/{_kernel}")(_bench_smoothing(_kernel, _weight))
+
+
+@case("rendering/plot")
+def bench_render(data, work_dir):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from toolbox.logs_util import read_tensorboard
+    from toolbox.plot import plot
+    from toolbox.settings import BASE_DIR
+
+    logs = read_tensorboard(data.paths, data.log_keys, stats_key="/seed", num_scalars=0)
+    with open(os.path.join(BASE_DIR, "experiments", "plot.yml")) as f:
+        figure = yaml.safe_load(f)
+    figure.pop("savedir")
+    figure.update(
+        logs=logs[data.tags[0]],
+        labels=None,
+        output=os.path.join(work_dir, "plot.png"),
+        xsteps=logs["trainer/epoch"],
+        dpi=100,
+    )
+    return lambda: plot(**figure)
+
+
+def _make_logger(work_dir, progress_file):
+    from toolbox.logger import Logger
+
+    logger = Logger()
+    log_dir = tempfile.mkdtemp(dir=work_dir)
+    logger.set_snapshot_dir(log_dir)
+    logger.set_progress_file(progress_file)
+    return logger
+
+
+def _bench_dump_log(progress_file):
+    def bench(data, work_dir):
+        num_rows = data.params["num_steps"] // 10
+        keys = [f"train/key{k}" for k in range(data.params["num_tags"])]
+
+        def run():
+            logger = _make_logger(work_dir, progress_file)
+            # dump_log prints every entry
+            with open(os.devnull, "w") as devnull:
+                with contextlib.redirect_stdout(devnull):
+                    for i in range(num_rows):
+                        for k in keys:
+                            logger.record_entry(k, float(i))
+                        logger.dump_log()
+            logger.close()
+
+        return run
+
+    return bench
+
+
+for _progress_file in ("progress.yml", "progress.csv"):
+    case(f"logging/{_progress_file}")(_bench_dump_log(_progress_file))
+
+
+@case("logging/tensorboard")
+def bench_record_tensorboard(data, work_dir):
+    num_rows = data.params["num_steps"] // 10
+    row = {f"key_{k}": 0.0 for k in range(data.params["num_tags"])}
+
+    def run():
+        logger = _make_logger(work_dir, "progress.yml")
+        for i in range(num_rows):
+            logger.record_tensorboard(row, i, "train")
+        logger.close()
+
+    return run
+
+
+def _checkpoint_params(scale):
+    import torch
+
+    # a few large tensors and many small ones, like a network and its optimizer
+    num_floats = CHECKPOINT_SIZES[scale] // 4
+    generator = torch.Generator().manual_seed(0)
+    params = {
+        f"layer{i}.weight": torch.randn(num_floats // 8, generator=generator)
+        for i in range(4)
+    }
+    params.update(
+        {
+            f"norm{i}.bias": torch.randn(num_floats // 2 // 64, generator=generator)
+            for i in range(32)
+        }
+    )
+    return params
+
+
+def _bench_checkpoint(use_store):
+    def bench(data, work_dir):
+        params = _checkpoint_params(data.scale)
+
+        def run():
+            logger = _make_logger(work_dir, "progress.yml")
+            logger.set_snapshot_mode("all")
+            logger.set_snapshot_store(use_store)
+            for itr in range(NUM_CHECKPOINTS):
+                # only the first tensor changes between iterations
+                params["layer0.weight"].add_(1)
+                logger.save_itr_params(itr, params)
+            logger.close()
+
+        return run
+
+    return bench
+
+
+case("checkpointing/files")(_bench_checkpoint(False))
+case("checkpointing/store")(_bench_checkpoint(True))
+
+
+@case("export/npz")
+def bench_export_npz(data, work_dir):
+    from toolbox.export import export_logs
+
+    logs = data.load()
+    return lambda: export_logs(logs, os.path.join(work_dir, "logs.npz"))
+
+
+def _toolbox_modules():
+    toolbox_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return sorted(
+        file_name[:-3]
+        for file_name in os.listdir(toolbox_dir)
+        if file_name.endswith(".py") and not file_name.startswith("_")
+    )
+
+
+def _bench_subprocess(*args):
+    """
+    Time a fresh interpreter running args, which includes its startup: see
+    startup/python for the part that does not depend on toolbox.
+    """
+
+    def bench(data, work_dir):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            p for p in (os.path.abspath(root), env.get("PYTHONPATH")) if p
+        )
+        command = [sys.executable, *args]
+        return lambda: subprocess.run(
+            command, env=env, check=True, stdout=subprocess.DEVNULL
+        )
+
+    return bench
+
+
+case("startup/python")(_bench_subprocess("-c", "pass"))
+case("startup/report_help")(_bench_subprocess("-m", "toolbox.report", "--help"))
+for _module in _toolbox_modules():
+    case(f"import/{_module}")(_bench_subprocess("-c", f"import toolbox.{_module}"))
+
+
+def measure(fn, repeat):
+    """
+    Best wall time of repeat calls, then peak memory allocated by Python and
+    numpy during one more call, apart so that tracing does not slow timings.
+    """
+    wall_times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        wall_times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "wall_time": min(wall_times),
+        "wall_times": wall_times,
+        "peak_memory": peak_memory,
+    }
+
+
+def select_cases(only):
+    if not only:
+        return list(CASES)
+    names = [name for name in CASES if any(name.startswith(o) for o in only)]
+    if not names:
+        raise click.BadParameter(f"no benchmark matches {only}, see {list(CASES)}")
+    return names
+
+
+def run_benchmarks(scales, names, repeat, tree_dir, output=None):
+    work_dir = tempfile.mkdtemp(prefix="toolbox_bench_")
+    tree_dir = tree_dir or os.path.join(work_dir, "trees")
+    results = []
+    try:
+        for scale in scales:
+            start = time.perf_counter()
+            data = Data(tree_dir, scale)
+            print(f"{scale} tree ready in {time.perf_counter() - start:.1f}s")
+            for name in names:
+                fn = CASES[name](data, work_dir)
+                result = {"name": name, "scale": scale, "params": data.params}
+                result.update(measure(fn, repeat))
+                results.append(result)
+                print(
+                    "{:>28} {:>6}: {:9.4f}s {:9.1f}MB".format(
+                        name, scale, result["wall_time"], result["peak_memory"] / 2**20
+                    )
+                )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    report = {"meta": environment(), "results": results}
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": datetime.datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare_reports(before, after):
+    """
+    (name, scale, before, after) of the wall time and peak memory of the
+    benchmarks in both reports.
+    """
+    before_results = {(r["name"], r["scale"]): r for r in before["results"]}
+    rows = []
+    for result in after["results"]:
+        key = (result["name"], result["scale"])
+        if key in before_results:
+            rows.append((*key, before_results[key], result))
+    return rows
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.option(
+    "--scale",
+    "-s",
+    "scales",
+    type=click.Choice(list(SCALES)),
+    multiple=True,
+    default=["small"],
+)
+@click.option("--only", multiple=True, help="benchmark name prefix, eg loading/")
+@click.option("--repeat", "-r", type=int, default=3)
+@click.option("--output", "-o", type=str, default=None, help="JSON results")
+@click.option(
+    "--tree-dir",
+    type=str,
+    default=None,
+    help="keep the synthetic trees there to reuse them",
+)
+def run(scales, only, repeat, output, tree_dir):
+    run_benchmarks(scales, select_cases(only), repeat, tree_dir, output)
+
+
+@main.command()
+@click.argument("before", type=click.Path(exists=True))
+@click.argument("after", type=click.Path(exists=True))
+def compare(before, after):
+    reports = []
+    for path in (before, after):
+        with open(path) as f:
+            reports.append(json.load(f))
+    print(
+        "before: {}\nafter:  {}".format(
+            reports[0]["meta"]["commit"], reports[1]["meta"]["commit"]
+        )
+    )
+    print(
+        "{:>28} {:>6} {:>10} {:>10} {:>7} {:>9}".format(
+            "benchmark", "scale", "before", "after", "speedup", "memory"
+        )
+    )
+    for name, scale, old, new in compare_reports(*reports):
+        speedup = old["wall_time"] / max(new["wall_time"], 1e-12)
+        memory = new["peak_memory"] / max(old["peak_memory"], 1)
+        print(
+            "{:>28} {:>6} {:9.4f}s {:9.4f}s {:6.2f}x {:8.2f}x".format(
+                name, scale, old["wall_time"], new["wall_time"], speedup, memory
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os
+import struct
+
+import numpy as np
+
+from toolbox.progress import YamlProgressWriter
+from toolbox.tfevents import _encode_varint
+
+# reflected CRC-32C polynomial, the checksum of TFRecords
+_CRC32C_POLY = 0x82F63B78
+_CRC_MASK_DELTA = 0xA282EAD8
+_START_TIME = 1.6e9
+
+
+def _crc32c_table():
+    crc = np.arange(256, dtype=np.uint32)
+    for _ in range(8):
+        crc = np.where(crc & 1, (crc >> 1) ^ _CRC32C_POLY, crc >> 1).astype(np.uint32)
+    return crc
+
+
+_CRC32C_TABLE = _crc32c_table()
+
+
+def masked_crc32c(data):
+    """
+    Masked CRC-32C of every row of a (num_records, length) uint8 array, all
+    rows at once: the Python implementation tensorboard checks records with
+    is far too slow to write large files.
+    """
+    crc = np.full(len(data), 0xFFFFFFFF, dtype=np.uint32)
+    for i in range(data.shape[1]):
+        crc = _CRC32C_TABLE[(crc ^ data[:, i]) & 0xFF] ^ (crc >> 8)
+    crc ^= np.uint32(0xFFFFFFFF)
+    crc = ((crc >> 15) | (crc << 17)) + np.uint32(_CRC_MASK_DELTA)
+    return crc.astype(np.uint32)
+
+
+def scalar_event(step, wall_time, tag, value):
+    """
+    Serialized Event holding one simple_value, as SummaryWriter writes it.
+    """
+    tag = tag.encode()
+    value = (
+        b"\x0a" + _encode_varint(len(tag)) + tag + b"\x15" + struct.pack("<f", value)
+    )
+    summary = b"\x0a" + _encode_varint(len(value)) + value
+    return (
+        b"\x09"
+        + struct.pack("<d", wall_time)
+        + b"\x10"
+        + _encode_varint(step)
+        + b"\x2a"
+        + _encode_varint(len(summary))
+        + summary
+    )
+
+
+def write_records(path, payloads):
+    """
+    Write payloads as TFRecords with valid checksums.
+    """
+    by_length = {}
+    for i, payload in enumerate(payloads):
+        by_length.setdefault(len(payload), []).append(i)
+    footers = [None] * len(payloads)
+    headers = {}
+    for length, indices in by_length.items():
+        data = b"".join(payloads[i] for i in indices)
+        data = np.frombuffer(data, dtype=np.uint8).reshape(len(indices), length)
+        for i, crc in zip(indices, masked_crc32c(data).tolist()):
+            footers[i] = struct.pack("<I", crc)
+        header = struct.pack("<Q", length)
+        headers[length] = header + struct.pack(
+            "<I", int(masked_crc32c(np.frombuffer(header, dtype=np.uint8)[None])[0])
+        )
+    with open(path, "wb") as f:
+        for payload, footer in zip(payloads, footers):
+            f.write(headers[len(payload)] + payload + footer)
+
+
+def run_values(num_steps, seed):
+    """
+    Noisy decreasing curve with a few spikes, float32 like tensorboard.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_steps)
+    values = np.exp(-t / max(num_steps / 3, 1)) + 0.05 * np.sin(t / 50)
+    values += 0.02 * rng.standard_normal(num_steps)
+    values[rng.random(num_steps) < 1e-3] += 1
+    return values.astype(np.float32)
+
+
+def make_tfevents_tree(
+    root, num_exps=2, num_seeds=3, num_tags=4, num_steps=1000, seed=0
+):
+    """
+    Write root/exp{i}/seed{j}/events.out.tfevents.* files with num_tags
+    scalar tags "train/tag{k}" logged at every step, plus "trainer/epoch"
+    every 10 steps. Returns the experiment paths and the tags.
+    """
+    tags = [f"train/tag{k}" for k in range(num_tags)]
+    paths = []
+    for i in range(num_exps):
+        exp_path = os.path.join(root, f"exp{i}")
+        paths.append(exp_path)
+        for j in range(num_seeds):
+            run_dir = os.path.join(exp_path, f"seed{j}")
+            os.makedirs(run_dir, exist_ok=True)
+            values = [
+                run_values(num_steps, (seed, i, j, k)).tolist() for k in range(num_tags)
+            ]
+            wall_times = _START_TIME + np.arange(num_steps) * 0.1
+            payloads = []
+            for step, wall_time in enumerate(wall_times.tolist()):
+                for tag, tag_values in zip(tags, values):
+                    payloads.append(
+                        scalar_event(step, wall_time, tag, tag_values[step])
+                    )
+                if step % 10 == 0:
+                    payloads.append(
+                        scalar_event(step, wall_time, "trainer/epoch", step // 10)
+                    )
+            write_records(
+                os.path.join(run_dir, "events.out.tfevents.0.synthetic"), payloads
+            )
+    return paths, tags
+
+
+def make_progress_file(path, num_rows=1000, num_keys=10, seed=0):
+    """
+    progress.yml with num_rows records of num_keys values, as dump_log
+    writes them. Returns the keys.
+    """
+    keys = [f"train/key{k}" for k in range(num_keys)]
+    rng = np.random.default_rng(seed)
+    values = rng.standard_normal((num_rows, num_keys)).tolist()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    writer = YamlProgressWriter(path, flush_every=1000)
+    for i, row in enumerate(values):
+        record = dict(zip(keys, row))
+        record["timestamp/"] = _START_TIME + i
+        writer.write(record)
+    writer.close()
+    return keys
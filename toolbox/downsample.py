@@ -0,0 +1,390 @@
+import random
+
+import numpy as np
+
+COLUMNS = ("steps", "timestamps", "values")
+
+
+class Sampler:
+    """
+    Streaming reduction of a scalar series to about num_points points.
+
+    Chunks of (steps, timestamps, values) arrays are fed in order through
+    update() and result() returns the kept points as {column: array}. Memory
+    is bounded by num_points, not by the length of the series, except for
+    FullSampler which keeps everything.
+    """
+
+    def __init__(self, num_points):
+        self.num_points = num_points
+
+    def update(self, steps, timestamps, values):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+
+class FullSampler(Sampler):
+    def __init__(self, num_points=0):
+        super().__init__(num_points)
+        self._chunks = []
+
+    def update(self, steps, timestamps, values):
+        # chunks may be views on a reader's reused buffers
+        self._chunks.append([np.array(c) for c in (steps, timestamps, values)])
+
+    def result(self):
+        return _concat_chunks(self._chunks)
+
+
+class ReservoirSampler(Sampler):
+    """
+    Same sampling as tensorboard's reservoir with always_keep_last, so that it
+    keeps exactly the points the EventAccumulator keeps.
+    """
+
+    def __init__(self, num_points, seed=0):
+        super().__init__(num_points)
+        self._random = random.Random(seed)
+        self._num_seen = 0
+        self._slots = None
+        # order of the slots in the reservoir
+        self._order = []
+
+    def update(self, steps, timestamps, values):
+        chunk = (steps, timestamps, values)
+        if self._slots is None:
+            self._slots = [np.empty(self.num_points, dtype=c.dtype) for c in chunk]
+
+        size = self.num_points
+        # slot -> index in the chunk of the item that ends up in it
+        writes = {}
+        for i in range(len(steps)):
+            n = self._num_seen
+            if len(self._order) < size:
+                slot = len(self._order)
+                self._order.append(slot)
+            else:
+                r = self._random.randint(0, n)
+                if r < size:
+                    slot = self._order.pop(r)
+                    self._order.append(slot)
+                else:
+                    slot = self._order[-1]
+            writes[slot] = i
+            self._num_seen = n + 1
+        if writes:
+            slots = np.fromiter(writes.keys(), dtype=np.int64, count=len(writes))
+            idx = np.fromiter(writes.values(), dtype=np.int64, count=len(writes))
+            for column, c in zip(self._slots, chunk):
+                column[slots] = c[idx]
+
+    def result(self):
+        if self._slots is None:
+            return _empty()
+        order = np.array(self._order, dtype=np.int64)
+        return {k: column[order] for k, column in zip(COLUMNS, self._slots)}
+
+
+class StrideSampler(Sampler):
+    """
+    Keep every stride-th point, doubling the stride whenever more than
+    2 * num_points points are kept. The last point is always kept.
+    """
+
+    def __init__(self, num_points):
+        super().__init__(num_points)
+        self._stride = 1
+        self._num_seen = 0
+        self._kept = None
+        self._num_kept = 0
+        self._last = None
+
+    def update(self, steps, timestamps, values):
+        chunk = (steps, timestamps, values)
+        n = len(steps)
+        if n == 0:
+            return
+        if self._kept is None:
+            capacity = 2 * max(self.num_points, 1)
+            self._kept = [np.empty(capacity, dtype=c.dtype) for c in chunk]
+        self._last = [c[n - 1] for c in chunk]
+        start = self._num_seen
+        self._num_seen += n
+        while True:
+            first = -start % self._stride
+            idx = np.arange(first, n, self._stride)
+            if self._num_kept + len(idx) <= len(self._kept[0]):
+                break
+            # too many points at this stride: keep one out of two
+            self._stride *= 2
+            keep = slice(0, self._num_kept, 2)
+            for column in self._kept:
+                kept = column[keep].copy()
+                column[: len(kept)] = kept
+            self._num_kept = len(range(0, self._num_kept, 2))
+        end = self._num_kept + len(idx)
+        for column, c in zip(self._kept, chunk):
+            column[self._num_kept : end] = c[idx]
+        self._num_kept = end
+
+    def result(self):
+        if self._kept is None:
+            return _empty()
+        kept = [column[: self._num_kept] for column in self._kept]
+
+        def num_points(step):
+            # the kept points at step, and the last point if it is not one
+            appended = (self._num_seen - 1) % (self._stride * step) != 0
+            return len(range(0, self._num_kept, step)) + appended
+
+        # a series that already fits is returned whole
+        step = 1
+        while num_points(step) > max(self.num_points, 2):
+            step *= 2
+        kept = [column[::step] for column in kept]
+        if (self._num_seen - 1) % (self._stride * step):
+            kept = [np.append(column, last) for column, last in zip(kept, self._last)]
+        return dict(zip(COLUMNS, kept))
+
+
+class MinMaxSampler(Sampler):
+    """
+    Split the series into consecutive buckets and keep the minimum and the
+    maximum of each one, so that spikes survive any reduction. Buckets are
+    merged two by two whenever there are more than num_points / 2 of them.
+    The first and last points are always kept.
+    """
+
+    def __init__(self, num_points):
+        super().__init__(num_points)
+        self.num_buckets = max(num_points // 2, 1)
+        self._width = 1
+        self._num_seen = 0
+        # per bucket: index, step, timestamp and value of its min and its max
+        self._min = None
+        self._max = None
+        self._num_buckets = 0
+        self._first = None
+        self._last = None
+
+    def update(self, steps, timestamps, values):
+        n = len(steps)
+        if n == 0:
+            return
+        chunk = (steps, timestamps, values)
+        if self._min is None:
+            self._first = [c[0] for c in chunk]
+            dtypes = [np.int64] + [c.dtype for c in chunk]
+            self._min = [np.empty(self.num_buckets, dtype=d) for d in dtypes]
+            self._max = [np.empty(self.num_buckets, dtype=d) for d in dtypes]
+        self._last = [c[n - 1] for c in chunk]
+
+        index = np.arange(self._num_seen, self._num_seen + n)
+        self._num_seen += n
+        while (index[-1] // self._width) + 1 > self.num_buckets:
+            self._merge()
+        bucket = index // self._width
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        bucket_ids = bucket[starts]
+        imin = _argreduce(values, starts, np.minimum)
+        imax = _argreduce(values, starts, np.maximum)
+
+        # the first bucket of the chunk may continue the last stored one
+        if self._num_buckets and bucket_ids[0] == self._num_buckets - 1:
+            b = self._num_buckets - 1
+            i, j = imin[0], imax[0]
+            if values[i] < self._min[3][b]:
+                _set(self._min, b, (index[i], steps[i], timestamps[i], values[i]))
+            if values[j] > self._max[3][b]:
+                _set(self._max, b, (index[j], steps[j], timestamps[j], values[j]))
+            bucket_ids, imin, imax = bucket_ids[1:], imin[1:], imax[1:]
+        for stored, idx in ((self._min, imin), (self._max, imax)):
+            for column, c in zip(stored, (index,) + chunk):
+                column[bucket_ids] = c[idx]
+        if len(bucket_ids):
+            self._num_buckets = bucket_ids[-1] + 1
+
+    def _merge(self):
+        n = self._num_buckets
+        pairs = (n + 1) // 2
+        for stored, better in ((self._min, np.less), (self._max, np.greater)):
+            left = np.arange(0, n, 2)
+            right = np.minimum(left + 1, n - 1)
+            pick = np.where(better(stored[3][right], stored[3][left]), right, left)
+            for column in stored:
+                column[:pairs] = column[pick]
+        self._num_buckets = pairs
+        self._width *= 2
+
+    def points(self):
+        """
+        Index, step, timestamp and value arrays of the kept points, sorted.
+        """
+        if self._min is None:
+            return [np.empty(0, dtype=np.int64)] + [np.empty(0) for _ in COLUMNS]
+        n = self._num_buckets
+        firsts = [0] + self._first
+        lasts = [self._num_seen - 1] + self._last
+        points = [
+            np.concatenate(
+                (
+                    np.array([first], dtype=mins.dtype),
+                    mins[:n],
+                    maxs[:n],
+                    np.array([last], dtype=mins.dtype),
+                )
+            )
+            for first, last, mins, maxs in zip(firsts, lasts, self._min, self._max)
+        ]
+        _, order = np.unique(points[0], return_index=True)
+        return [p[order] for p in points]
+
+    def result(self):
+        if self._min is None:
+            return _empty()
+        return dict(zip(COLUMNS, self.points()[1:]))
+
+
+class LTTBSampler(MinMaxSampler):
+    """
+    Largest-Triangle-Three-Buckets down to num_points points, run on the
+    candidates of a min/max reduction with four times more buckets so that
+    the full series never has to be held in memory.
+    """
+
+    def __init__(self, num_points):
+        super().__init__(4 * num_points)
+        self.num_points = num_points
+
+    def result(self):
+        if self._min is None:
+            return _empty()
+        _, steps, timestamps, values = self.points()
+        idx = lttb_indices(steps, values, self.num_points)
+        return {
+            "steps": steps[idx],
+            "timestamps": timestamps[idx],
+            "values": values[idx],
+        }
+
+
+def lttb_indices(x, y, num_points):
+    """
+    Indices of the points selected by Largest-Triangle-Three-Buckets.
+    """
+    n = len(x)
+    if num_points >= n or num_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, num_points - 1).astype(np.int64)
+    selected = np.empty(num_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(num_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_start = end if end < next_end else n - 1
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_decimate(x, values, num_buckets, x_range=None, log=False):
+    """
+    Indices of the points to draw so that the line of values, (N,) or
+    (N, k) like the mean, min and max of a band, looks the same over
+    num_buckets pixel columns: in each column, the first, last, minimum and
+    maximum point of every column of values. Columns split x_range, the data
+    range by default, linearly or in log scale; points beyond it are bucketed
+    the same way on each side. NaNs are kept so that gaps stay gaps. x must
+    be sorted, otherwise every index is returned.
+    """
+    x = np.asarray(x, dtype=np.float64).reshape(-1)
+    values = np.asarray(values).reshape(len(x), -1)
+    n = len(x)
+    if n <= 4 * num_buckets or not (x[1:] >= x[:-1]).all():
+        return np.arange(n)
+    if x_range is None:
+        x_range = (x[0], x[-1])
+    low, high = x_range
+    if log:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x, low, high = np.log10(x), np.log10(low), np.log10(high)
+    if not high > low:
+        return np.arange(n)
+    bucket = np.floor((x - low) / (high - low) * num_buckets)
+    bucket = np.clip(np.nan_to_num(bucket, nan=-1), -1, num_buckets)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    kept = [starts, ends, np.flatnonzero(np.isnan(values).any(axis=1))]
+    for column in values.T:
+        # fmin and fmax ignore NaNs
+        kept.append(_argreduce(column, starts, np.fmin))
+        kept.append(_argreduce(column, starts, np.fmax))
+    return np.unique(np.concatenate(kept))
+
+
+SAMPLERS = {
+    "reservoir": ReservoirSampler,
+    "full": FullSampler,
+    "stride": StrideSampler,
+    "minmax": MinMaxSampler,
+    "lttb": LTTBSampler,
+}
+
+
+def make_sampler(sampling, num_points):
+    """
+    Build the sampler of a strategy; num_points=0 keeps every point.
+    """
+    if sampling not in SAMPLERS:
+        raise ValueError(f"sampling should be in {tuple(SAMPLERS)}, got {sampling}")
+    if num_points == 0:
+        return FullSampler()
+    return SAMPLERS[sampling](num_points)
+
+
+def _argreduce(values, starts, ufunc):
+    """
+    Index of the first minimum / maximum of each [starts[i], starts[i + 1]).
+    """
+    reduced = ufunc.reduceat(values, starts)
+    lengths = np.diff(np.r_[starts, len(values)])
+    hits = np.flatnonzero(values == np.repeat(reduced, lengths))
+    # first hit at or after each bucket start; NaN buckets fall back to start
+    first = np.searchsorted(hits, starts)
+    first = np.minimum(first, len(hits) - 1) if len(hits) else first
+    idx = hits[first] if len(hits) else starts.copy()
+    ends = starts + lengths
+    return np.where((idx >= starts) & (idx < ends), idx, starts)
+
+
+def _set(stored, b, point):
+    for column, v in zip(stored, point):
+        column[b] = v
+
+
+def _concat_chunks(chunks):
+    if not chunks:
+        return _empty()
+    return {
+        k: np.concatenate([chunk[i] for chunk in chunks]) for i, k in enumerate(COLUMNS)
+    }
+
+
+def _empty():
+    return {
+        "steps": np.empty(0, dtype=np.int64),
+        "timestamps": np.empty(0, dtype=np.float64),
+        "values": np.empty(0, dtype=np.float64),
+    }
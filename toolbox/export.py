@@ -0,0 +1,243 @@
+"""
+Long format columnar export of logs, one row per point of a run and tag.
+
+    python -m toolbox.export write logs.npz /path/to/exps -k train/loss
+    python -m toolbox.export write logs.parquet /path/to/exps -k train/loss
+    python -m toolbox.export columns logs.npz
+
+Exports are read back with load_export, by pandas.DataFrame(load_export(path))
+or, for Parquet, by pandas.read_parquet.
+"""
+import os
+
+import click
+import numpy as np
+
+from toolbox.downsample import SAMPLERS
+from toolbox.logs_util import BANDS, READERS, read_tensorboard
+
+FORMATS = {".npz": "npz", ".parquet": "parquet"}
+# run and tag are stored as int32 codes into these arrays of names
+_CATEGORICAL = {"run": "run_names", "tag": "tag_names"}
+
+
+def export_format(path):
+    _, ext = os.path.splitext(path)
+    if ext not in FORMATS:
+        raise ValueError(f"export path should end with one of {tuple(FORMATS)}")
+    return FORMATS[ext]
+
+
+def export_columns(logs, log_keys=None, runs=None):
+    """
+    {column: array} of the {log_key: {run_name: log}} logs of
+    read_tensorboard, in long format with rows grouped by tag then run. The
+    run and tag columns are int32 codes into the "run_names" and
+    "tag_names" arrays. Logs with (N, 3) values, see aggregate_logs, fill
+    the lower and upper columns, which are NaN for the other logs.
+    log_keys and runs select the tags and runs to export, all by default.
+    """
+    selected = [
+        (log_key, name, log)
+        for log_key, log_runs in logs.items()
+        if log_keys is None or log_key in log_keys
+        for name, log in log_runs.items()
+        if runs is None or name in runs
+    ]
+    tag_names = list(dict.fromkeys(log_key for log_key, _, _ in selected))
+    run_names = sorted({name for _, name, _ in selected})
+    tag_codes = {tag: i for i, tag in enumerate(tag_names)}
+    run_codes = {name: i for i, name in enumerate(run_names)}
+    lengths = [len(log["steps"]) for _, _, log in selected]
+    num_rows = sum(lengths)
+    has_band = any(log["values"].shape[1] > 1 for _, _, log in selected)
+
+    def column(key):
+        dtypes = [log[key].dtype for _, _, log in selected]
+        return np.empty(num_rows, dtype=np.result_type(*dtypes) if dtypes else float)
+
+    # preallocated and filled run by run, each point is copied once
+    columns = {
+        "run": np.empty(num_rows, dtype=np.int32),
+        "tag": np.empty(num_rows, dtype=np.int32),
+        "step": column("steps"),
+        "timestamp": column("timestamps"),
+        "value": column("values"),
+    }
+    if has_band:
+        columns["lower"] = np.full(num_rows, np.nan, dtype=columns["value"].dtype)
+        columns["upper"] = np.full(num_rows, np.nan, dtype=columns["value"].dtype)
+    start = 0
+    for (log_key, name, log), length in zip(selected, lengths):
+        rows = slice(start, start + length)
+        columns["run"][rows] = run_codes[name]
+        columns["tag"][rows] = tag_codes[log_key]
+        columns["step"][rows] = log["steps"][:, 0]
+        columns["timestamp"][rows] = log["timestamps"][:, 0]
+        columns["value"][rows] = log["values"][:, 0]
+        if log["values"].shape[1] > 1:
+            columns["lower"][rows] = log["values"][:, 1]
+            columns["upper"][rows] = log["values"][:, 2]
+        start += length
+    columns["run_names"] = np.array(run_names, dtype=str)
+    columns["tag_names"] = np.array(tag_names, dtype=str)
+    return columns
+
+
+def export_logs(logs, path, log_keys=None, runs=None):
+    """
+    Write the export_columns of logs to path in a single write, a
+    compressed .npz or a .parquet file, which needs pyarrow. In Parquet,
+    run and tag are dictionary columns, read by pandas as categoricals.
+    Returns the number of rows.
+    """
+    fmt = export_format(path)
+    columns = export_columns(logs, log_keys, runs)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if fmt == "npz":
+        np.savez_compressed(path, **columns)
+    else:
+        pa, pq = _import_pyarrow()
+        arrays = {}
+        for name, array in columns.items():
+            if name in _CATEGORICAL.values():
+                continue
+            if name in _CATEGORICAL:
+                arrays[name] = pa.DictionaryArray.from_arrays(
+                    array, pa.array(columns[_CATEGORICAL[name]])
+                )
+            else:
+                arrays[name] = pa.array(array)
+        pq.write_table(pa.table(arrays), path)
+    return len(columns["step"])
+
+
+def list_export_columns(path):
+    """
+    Columns of an export, without reading them.
+    """
+    if export_format(path) == "npz":
+        with np.load(path) as npz:
+            names = npz.files
+    else:
+        _, pq = _import_pyarrow()
+        names = pq.read_schema(path).names
+    return [name for name in names if name not in _CATEGORICAL.values()]
+
+
+def load_export(path, columns=None, categorical=False):
+    """
+    {column: array} of the columns of an export, all by default. Only those
+    columns are read from the file. run and tag are arrays of names, or with
+    categorical, int32 codes into the "run_names" and "tag_names" arrays,
+    which are then returned too.
+    """
+    available = list_export_columns(path)
+    if columns is None:
+        columns = available
+    missing = [name for name in columns if name not in available]
+    if missing:
+        raise KeyError(f"{path} has no columns {missing}, it has {available}")
+
+    loaded = {}
+    if export_format(path) == "npz":
+        # members of an npz are decompressed one by one, when accessed
+        with np.load(path) as npz:
+            for name in columns:
+                loaded[name] = npz[name]
+                if name in _CATEGORICAL:
+                    loaded[_CATEGORICAL[name]] = npz[_CATEGORICAL[name]]
+    else:
+        _, pq = _import_pyarrow()
+        # row groups may have their own dictionaries of run and tag names
+        table = pq.read_table(path, columns=list(columns)).unify_dictionaries()
+        for name in columns:
+            chunks = table.column(name).combine_chunks()
+            if name in _CATEGORICAL:
+                loaded[name] = chunks.indices.to_numpy().astype(np.int32)
+                loaded[_CATEGORICAL[name]] = np.array(
+                    chunks.dictionary.to_pylist(), dtype=str
+                )
+            else:
+                loaded[name] = chunks.to_numpy()
+
+    if not categorical:
+        for name, names_key in _CATEGORICAL.items():
+            if name in loaded:
+                loaded[name] = loaded.pop(names_key)[loaded[name]]
+    return loaded
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "Parquet export needs pyarrow, pip install pyarrow or export to .npz"
+        )
+    return pa, pq
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.argument("output", type=str)
+@click.argument("paths", type=str, nargs=-1, required=True)
+@click.option("--key", "-k", "log_keys", type=str, multiple=True, required=True)
+@click.option("--filter", "filters_exp", type=str, multiple=True)
+@click.option("--stats-key", "-sk", type=str, default=None)
+@click.option("--worker-key", type=str, default=None, help="average runs over workers")
+@click.option("--band", type=click.Choice(BANDS), default="minmax")
+@click.option("--workers", "-w", type=int, default=None)
+@click.option("--cache-dir", type=str, default=None, help="scalar cache directory")
+@click.option("--reader", type=click.Choice(READERS), default="native")
+@click.option("--sampling", type=click.Choice(SAMPLERS), default="reservoir")
+@click.option("--num-scalars", type=int, default=0, help="0 keeps every point")
+@click.option("--index", type=str, default=None, help="event file index database")
+def write(
+    output,
+    paths,
+    log_keys,
+    filters_exp,
+    stats_key,
+    worker_key,
+    band,
+    workers,
+    cache_dir,
+    reader,
+    sampling,
+    num_scalars,
+    index,
+):
+    export_format(output)
+    logs = read_tensorboard(
+        paths,
+        list(log_keys),
+        stats_key=stats_key,
+        filters_exp=filters_exp or None,
+        workers=workers,
+        cache_dir=cache_dir,
+        reader=reader,
+        sampling=sampling,
+        num_scalars=num_scalars,
+        worker_key=worker_key,
+        band=band,
+        index=index,
+    )
+    num_rows = export_logs(logs, output)
+    print(f"{num_rows} rows written to {output}")
+
+
+@main.command()
+@click.argument("path", type=str)
+def columns(path):
+    for name in list_export_columns(path):
+        print(name)
+
+
+if __name__ == "__main__":
+    main()
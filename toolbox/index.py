@@ -0,0 +1,280 @@
+"""
+SQLite index of the event files of experiment trees.
+
+    python -m toolbox.index update index.db /path/to/exps
+    python -m toolbox.index query index.db /path/to/exps --tag train/loss \
+        --since 2021-06-01
+"""
+import datetime
+import glob
+import os
+import sqlite3
+
+import click
+
+from toolbox.tfevents import iter_scalar_chunks
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    run TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    min_step INTEGER,
+    max_step INTEGER,
+    last_wall_time REAL
+);
+CREATE TABLE IF NOT EXISTS tags (
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    num_points INTEGER NOT NULL,
+    min_step INTEGER NOT NULL,
+    max_step INTEGER NOT NULL,
+    last_wall_time REAL NOT NULL,
+    PRIMARY KEY (path, tag)
+);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+"""
+_MERGE_TAG = """
+INSERT INTO tags VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (path, tag) DO UPDATE SET
+    num_points = num_points + excluded.num_points,
+    min_step = min(min_step, excluded.min_step),
+    max_step = max(max_step, excluded.max_step),
+    last_wall_time = max(last_wall_time, excluded.last_wall_time)
+"""
+_FILE_RANGES = """
+UPDATE files SET
+    min_step = (SELECT min(min_step) FROM tags WHERE tags.path = files.path),
+    max_step = (SELECT max(max_step) FROM tags WHERE tags.path = files.path),
+    last_wall_time = (
+        SELECT max(last_wall_time) FROM tags WHERE tags.path = files.path
+    )
+WHERE path = ?
+"""
+
+
+class EventIndex:
+    """
+    Run, size, mtime, step range and last wall time of every indexed event
+    file, and the number of points, step range and last wall time of each
+    of its scalar tags.
+
+    update() only opens files whose size or mtime changed, and reads a file
+    that grew from the end of the last record it indexed. Queries never
+    open event files. Only simple_value scalars are indexed, the summaries
+    toolbox reads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=60)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def update(self, roots, pattern="*tfevents*"):
+        """
+        Index the new and changed files matching pattern under roots and
+        forget the indexed files under roots that were deleted. Returns the
+        number of files (read, removed).
+        """
+        num_read = 0
+        found = set()
+        for root in roots:
+            for path in glob.glob(os.path.join(root, "**", pattern), recursive=True):
+                path = os.path.abspath(path)
+                found.add(path)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                row = self._db.execute(
+                    "SELECT size, mtime, offset FROM files WHERE path = ?", (path,)
+                ).fetchone()
+                if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                # a file that shrank was rewritten, it is read again
+                offset = row[2] if row is not None and row[0] <= stat.st_size else 0
+                self._index_file(path, stat, offset)
+                num_read += 1
+
+        removed = [
+            path
+            for root in roots
+            for path in self._indexed_files(root)
+            if path not in found
+        ]
+        with self._db:
+            self._db.executemany(
+                "DELETE FROM files WHERE path = ?", [(path,) for path in removed]
+            )
+        return num_read, len(removed)
+
+    def _index_file(self, path, stat, offset):
+        with self._db:
+            if offset == 0:
+                self._db.execute("DELETE FROM tags WHERE path = ?", (path,))
+            # an upsert, replacing the row would cascade to its tags
+            self._db.execute(
+                "INSERT INTO files (path, run, size, mtime, offset) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET "
+                "size = excluded.size, mtime = excluded.mtime",
+                (path, os.path.dirname(path), stat.st_size, stat.st_mtime_ns, offset),
+            )
+            try:
+                for end, chunk in iter_scalar_chunks(path, offset=offset):
+                    self._db.executemany(
+                        _MERGE_TAG,
+                        [
+                            (
+                                path,
+                                tag,
+                                len(scalar["steps"]),
+                                int(scalar["steps"].min()),
+                                int(scalar["steps"].max()),
+                                float(scalar["timestamps"].max()),
+                            )
+                            for tag, scalar in chunk.items()
+                        ],
+                    )
+                    offset = end
+            except Exception as e:
+                # indexed up to the last good chunk, read again once it changes
+                print(
+                    f"WARNING: could not index all of {path} ({type(e).__name__}: {e})."
+                )
+            self._db.execute(
+                "UPDATE files SET offset = ? WHERE path = ?", (offset, path)
+            )
+            self._db.execute(_FILE_RANGES, (path,))
+
+    def _indexed_files(self, root):
+        prefix = os.path.join(os.path.abspath(root), "")
+        rows = self._db.execute(
+            "SELECT path FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+        )
+        return [path for path, in rows]
+
+    def query(
+        self, roots, tags=None, any_tags=None, updated_since=None, filters_exp=None
+    ):
+        """
+        Sorted (log_file, root) of the indexed files under roots, like
+        logs_util.find_log_files, that have all of tags, at least one of
+        any_tags, a last wall time after the updated_since timestamp and
+        contain one of filters_exp.
+        """
+        conditions = []
+        params = []
+        for tag in tags or ():
+            conditions.append(
+                "EXISTS (SELECT 1 FROM tags WHERE tags.path = files.path AND tag = ?)"
+            )
+            params.append(tag)
+        if any_tags:
+            conditions.append(
+                "EXISTS (SELECT 1 FROM tags WHERE tags.path = files.path "
+                "AND tag IN ({}))".format(", ".join("?" * len(any_tags)))
+            )
+            params += list(any_tags)
+        if updated_since is not None:
+            conditions.append("last_wall_time >= ?")
+            params.append(updated_since)
+
+        log_files = []
+        for root in roots:
+            prefix = os.path.join(os.path.abspath(root), "")
+            sql = "SELECT path FROM files WHERE substr(path, 1, ?) = ?"
+            rows = self._db.execute(
+                " AND ".join([sql] + conditions), [len(prefix), prefix] + params
+            )
+            for (path,) in rows:
+                # paths as glob would give them, for run names and filters
+                log_file = os.path.join(root, os.path.relpath(path, prefix))
+                if not filters_exp or any(f in log_file for f in filters_exp):
+                    log_files.append((log_file, root))
+        log_files.sort(key=lambda x: x[0])
+        return log_files
+
+    def runs(self, roots, tags=None, updated_since=None, filters_exp=None):
+        """
+        Sorted run directories of the files matching query.
+        """
+        log_files = self.query(roots, tags, None, updated_since, filters_exp)
+        return sorted({os.path.dirname(log_file) for log_file, _ in log_files})
+
+    def tags(self, log_file):
+        """
+        {tag: (num_points, min_step, max_step, last_wall_time)} of a file.
+        """
+        rows = self._db.execute(
+            "SELECT tag, num_points, min_step, max_step, last_wall_time "
+            "FROM tags WHERE path = ?",
+            (os.path.abspath(log_file),),
+        )
+        return {tag: tuple(stats) for tag, *stats in rows}
+
+
+def parse_time(value):
+    """
+    Timestamp of a number of seconds since the epoch or of an ISO date.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.argument("index", type=str)
+@click.argument("roots", type=str, nargs=-1, required=True)
+@click.option("--pattern", type=str, default="*tfevents*")
+def update(index, roots, pattern):
+    with EventIndex(index) as event_index:
+        num_read, num_removed = event_index.update(roots, pattern)
+    print(f"{num_read} files indexed, {num_removed} removed")
+
+
+@main.command()
+@click.argument("index", type=str)
+@click.argument("roots", type=str, nargs=-1, required=True)
+@click.option("--tag", "tags", type=str, multiple=True, help="tag the runs have")
+@click.option("--since", type=str, default=None, help="timestamp or ISO date")
+@click.option("--filter", "filters_exp", type=str, multiple=True)
+@click.option("--files", is_flag=True, help="list event files, not runs")
+@click.option("--no-update", is_flag=True, help="query without updating first")
+def query(index, roots, tags, since, filters_exp, files, no_update):
+    updated_since = None if since is None else parse_time(since)
+    with EventIndex(index) as event_index:
+        if not no_update:
+            event_index.update(roots)
+        if files:
+            results = [
+                log_file
+                for log_file, _ in event_index.query(
+                    roots, tags, None, updated_since, filters_exp
+                )
+            ]
+        else:
+            results = event_index.runs(roots, tags, updated_since, filters_exp)
+    for result in results:
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
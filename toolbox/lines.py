@@ -1,11 +1,15 @@
 import numpy as np
 from itertools import cycle
 
+from toolbox.downsample import minmax_decimate
+from toolbox.smoothing import smooth
+
 
 class Lines:
 
 
-    def __init__(self, resolution=20, smooth=None):
+    def __init__(self, resolution=20, smooth=None, smooth_kernel="ema",
+                 num_pixels=None, x_range=None, logx=False):
         self.COLORS = cycle([
             '#377eb8', '#e41a1c', '#4daf4a', '#984ea3', '#ff7f00', '#ffff33',
             '#a65628', '#f781bf'
@@ -14,6 +18,11 @@ class Lines:
         self.LEGEND = dict(fontsize='medium', labelspacing=0, numpoints=1)
         self._resolution = resolution
         self._smooth_weight = smooth
+        self._smooth_kernel = smooth_kernel
+        # lines are decimated to num_pixels columns over x_range if given
+        self._num_pixels = num_pixels
+        self._x_range = x_range
+        self._logx = logx
 
     def __call__(self, ax, domains, lines, labels):
         assert len(domains) == len(lines) == len(labels)
@@ -21,7 +30,12 @@ class Lines:
                     marker) in enumerate(zip(labels, self.COLORS,
                                              self.MARKERS)):
             domain, line = domains[index], lines[index]
-            line = self.smooth(line, self._smooth_weight)
+            # fill_between only takes 1d x, logs hold (N, 1) steps
+            domain = np.asarray(domain).reshape(-1)
+            if self._smooth_weight:
+                line = self.smooth(line, self._smooth_weight)
+            if self._num_pixels:
+                domain, line = self.decimate(domain, line)
             ax.plot(domain, line[:, 0], color=color, label=label)
             # ax.scatter(domain, line[:, 0], color=color, marker="x")
             if line.shape[1] > 1:
@@ -45,16 +59,19 @@ class Lines:
         for line in legend.get_lines():
             line.set_alpha(1)
 
+    def decimate(self, domain, line):
+        """
+        keep the first, last, min and max points of each pixel column, for
+        every column of line so that bands are preserved too
+        """
+        idx = minmax_decimate(domain, line, self._num_pixels, self._x_range,
+                              self._logx)
+        return domain[idx], np.asarray(line)[idx]
+
     def smooth(self, scalars, weight):
         """
-        weight in [0, 1]
-        exponential moving average, same as tensorboard
+        weight in [0, 1] for the ema kernels, exponential moving average,
+        same as tensorboard; window size or sigma in points otherwise,
+        see toolbox.smoothing
         """
-        assert weight >= 0 and weight <= 1
-        last = scalars[0]
-        smoothed = np.asarray(scalars)
-        for i, point in enumerate(scalars):
-            last = last * weight + (1 - weight) * point
-            smoothed[i] = last
-
-        return smoothed
+        return smooth(scalars, weight, self._smooth_kernel)
@@ -3,16 +3,26 @@ Based on rllab's logger.
 
 https://github.com/rll/rllab
 """
+import atexit
+import copy
 import datetime
 import errno
+import io
 import os
 import os.path as osp
+import re
 
 import dateutil.tz
-
-import torch
 import yaml
-from torch.utils.tensorboard import SummaryWriter
+
+from toolbox.async_writer import AsyncWriter
+from toolbox.metrics import STATS, MetricAccumulator
+from toolbox.progress import make_progress_writer
+from toolbox.snapshot_store import SnapshotStore, atomic_write
+from toolbox.timing import Timings
+
+# torch and its SummaryWriter are imported where needed, they take seconds to
+# import and scripts reading logs do not use them
 
 
 def mkdir_p(path, erase_path):
@@ -22,6 +32,30 @@ def mkdir_p(path, erase_path):
     #     raise ValueError("Path {} already exists.".format(path))
 
 
+ITR_FILE_NAME = re.compile(r"itr_(\d+)\.pkl")
+
+
+def snapshot_params(params):
+    """
+    Copy of params that training can no longer modify: tensors are cloned
+    on their device, containers are rebuilt and other objects deep copied.
+    """
+    import torch
+
+    if isinstance(params, torch.Tensor):
+        return params.detach().clone()
+    if isinstance(params, dict):
+        # shallow copy first to keep the type and attributes such as the
+        # _metadata of state dicts
+        snapshot = copy.copy(params)
+        for k, v in params.items():
+            snapshot[k] = snapshot_params(v)
+        return snapshot
+    if isinstance(params, (list, tuple)) and type(params) in (list, tuple):
+        return type(params)(snapshot_params(v) for v in params)
+    return copy.deepcopy(params)
+
+
 def setup_logger(
     exp_prefix,
     variant,
@@ -31,6 +65,7 @@ def setup_logger(
     snapshot_gap=1,
     log_dir=None,
 ):
+    logger.set_progress_file(tabular_log_file)
     if variant is not None:
         logger.log("Variant:")
         logger.log(yaml.dump(variant))
@@ -53,6 +88,26 @@ class Logger:
         self._snapshot_dir = None
         self._snapshot_mode = "all"
         self._snapshot_gap = 1
+        self._snapshot_keep_last = None
+        self._snapshot_writer = None
+        self._snapshot_store_dir = None
+        self._snapshot_store = None
+
+        self._progress_file = "progress.yml"
+        self._progress_flush_every = 1
+        self._progress_writer = None
+
+        self._async_writer = None
+        self._close_at_exit = False
+
+        self._timings = Timings()
+        self._timing_tb_step = None
+
+        self._accumulator = MetricAccumulator()
+        self._accumulate_stats = ("mean",)
+        self._tb_accumulator = None
+        self._tb_every = None
+        self._tb_last_step = None
 
     def log(self, s, with_timestamp=True):
         out = s
@@ -77,12 +132,25 @@ class Logger:
             self.pop_prefix()
 
     def record_tensorboard(self, d, global_step, prefix):
+        self._run(self._record_tensorboard, dict(d), global_step, prefix)
+        if self._timings.enabled and global_step != self._timing_tb_step:
+            # once per step, whatever the number of prefixes recorded
+            self._timing_tb_step = global_step
+            timings = self._timings.summary()
+            if timings:
+                self._run(self._record_timings_tensorboard, timings, global_step)
+
+    def _get_tb_log(self, prefix):
         if prefix not in self._tb_logs:
+            from torch.utils.tensorboard import SummaryWriter
+
             self._tb_logs[prefix] = SummaryWriter(
                 os.path.join(self._snapshot_dir, prefix)
             )
+        return self._tb_logs[prefix]
 
-        tb_log = self._tb_logs[prefix]
+    def _record_tensorboard(self, d, global_step, prefix):
+        tb_log = self._get_tb_log(prefix)
         for k, v in d.items():
             if k in [
                 "Average Returns",
@@ -97,6 +165,86 @@ class Logger:
                 k = k[:idx] + "/" + k[idx + 1 :]
             tb_log.add_scalar(k, v, global_step=global_step)
 
+    def _record_timings_tensorboard(self, timings, global_step):
+        tb_log = self._get_tb_log("timing")
+        for name, stats in timings.items():
+            for stat, value in stats.items():
+                tb_log.add_scalar(f"{name}/{stat}", value, global_step=global_step)
+
+    def set_timing(self, enabled=True, capacity=1024, percentiles=(50, 90, 99)):
+        """
+        Time the sections of timer() and timed(). Their count, total, mean,
+        max and percentiles over the last capacity calls are recorded under
+        timing/ by dump_log, and by record_tensorboard in the timing run.
+        Statistics cover the calls since the last dump_log.
+        """
+        if capacity != self._timings.capacity:
+            self._timings.timers = {}
+        self._timings.enabled = enabled
+        self._timings.capacity = capacity
+        self._timings.percentiles = tuple(percentiles)
+
+    def timer(self, name):
+        """
+        Context manager timing a section, a no-op unless set_timing is on.
+
+            with logger.timer("env_step"):
+                env.step(action)
+        """
+        return self._timings.section(name)
+
+    def timed(self, name=None):
+        """
+        Decorator timing the calls of a function, see timer.
+        """
+        return self._timings.timed(name)
+
+    def accumulate(self, d, global_step=None, prefix=None):
+        """
+        Deferred record_dict for metrics that are averaged over steps. Values
+        may be Python scalars, numpy arrays or tensors, kept on their device:
+        no .item() is needed, see toolbox.metrics.MetricAccumulator. The
+        accumulated stats are recorded by dump_log, and by
+        record_tensorboard every tensorboard_every steps, see set_accumulate.
+        """
+        prefix = prefix or ""
+        self._accumulator.add(d, prefix)
+        if self._tb_accumulator is None or global_step is None:
+            return
+        self._tb_accumulator.add(d, prefix)
+        if self._tb_last_step is None:
+            self._tb_last_step = global_step
+        elif global_step - self._tb_last_step >= self._tb_every:
+            self._tb_last_step = global_step
+            for tb_prefix, metrics in self._tb_accumulator.summary().items():
+                self.record_tensorboard(
+                    self._accumulated_entries(metrics, "_"), global_step, tb_prefix[:-1]
+                )
+            self._tb_accumulator.reset()
+
+    def set_accumulate(self, stats=("mean",), tensorboard_every=None):
+        """
+        Stats of accumulated metrics recorded by dump_log, among
+        toolbox.metrics.STATS: the mean is recorded under the key itself,
+        other stats under key/stat. With tensorboard_every, accumulate
+        also records them to tensorboard every tensorboard_every steps.
+        """
+        for stat in stats:
+            if stat not in STATS:
+                raise ValueError(f"stats should be in {STATS}, got {stat}")
+        self._accumulate_stats = tuple(stats)
+        self._tb_every = tensorboard_every
+        self._tb_accumulator = MetricAccumulator() if tensorboard_every else None
+        self._tb_last_step = None
+
+    def _accumulated_entries(self, metrics, separator):
+        entries = {}
+        for key, stats in metrics.items():
+            for stat in self._accumulate_stats:
+                name = key if stat == "mean" else f"{key}{separator}{stat}"
+                entries[name] = stats[stat]
+        return entries
+
     def push_prefix(self, prefix):
         self._prefixes.append(prefix)
         self._prefix_str = "".join(self._prefixes)
@@ -113,45 +261,240 @@ class Logger:
         return prc_value
 
     def dump_log(self):
-        for key, value in self._log_dict.items():
-            print("{}: {}".format(key, self.process_value(value)), flush=True)
-        progress_name = osp.join(self._snapshot_dir, "progress.yml")
         now = datetime.datetime.now(dateutil.tz.tzlocal())
+        for prefix, metrics in self._accumulator.summary().items():
+            for key, value in self._accumulated_entries(metrics, "/").items():
+                self._log_dict[prefix + key] = value
+        self._accumulator.reset()
+        if self._timings.enabled:
+            for name, stats in self._timings.summary().items():
+                for stat, value in stats.items():
+                    self._log_dict[f"timing/{name}/{stat}"] = value
+            self._timings.reset()
         self._log_dict["timestamp/"] = now.timestamp()
-        with open(progress_name, "a") as f:
-            a = yaml.dump(self._log_dict)
-            f.write(yaml.dump(self._log_dict))
-            f.write("§")
+        progress_name = osp.join(self._snapshot_dir, self._progress_file)
+        self._run(self._dump_log, self._log_dict, progress_name)
         self._log_dict = {}
 
+    def _dump_log(self, log_dict, progress_name):
+        for key, value in log_dict.items():
+            if key == "timestamp/":
+                continue
+            print("{}: {}".format(key, self.process_value(value)), flush=True)
+        self._get_progress_writer(progress_name).write(log_dict)
+
+    def _get_progress_writer(self, progress_name):
+        if self._progress_writer is None or self._progress_writer.path != progress_name:
+            self.close_progress()
+            self._progress_writer = make_progress_writer(
+                progress_name, self._progress_flush_every
+            )
+        return self._progress_writer
+
+    def flush_progress(self):
+        if self._progress_writer is not None:
+            self._progress_writer.flush()
+
+    def close_progress(self):
+        if self._progress_writer is not None:
+            self._progress_writer.close()
+            self._progress_writer = None
+
+    def set_async(self, enabled=True, max_queue=1024, policy="block"):
+        """
+        Run record_tensorboard and dump_log on a background writer thread.
+        When max_queue calls are pending, policy "block" waits and "drop"
+        discards the record, see toolbox.async_writer.AsyncWriter.
+        """
+        if self._async_writer is not None:
+            try:
+                self.flush()
+            finally:
+                async_writer, self._async_writer = self._async_writer, None
+                async_writer.close()
+        if enabled:
+            self._async_writer = AsyncWriter(max_queue, policy)
+            self._register_close_at_exit()
+
+    def _register_close_at_exit(self):
+        if not self._close_at_exit:
+            # pending records and snapshots are written before exiting
+            atexit.register(self.close)
+            self._close_at_exit = True
+
+    def num_dropped(self):
+        if self._async_writer is None:
+            return 0
+        return self._async_writer.num_dropped
+
+    def flush(self):
+        """
+        Wait for pending records and snapshots, and flush progress and
+        tensorboard files.
+        """
+        if self._snapshot_writer is not None:
+            self._snapshot_writer.flush()
+        if self._async_writer is None:
+            self._flush()
+        else:
+            self._async_writer.call(self._flush)
+            self._async_writer.flush()
+
+    def _flush(self):
+        self.flush_progress()
+        for tb_log in self._tb_logs.values():
+            tb_log.flush()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            # errors of background writes are raised once, files still close
+            self.set_async(False)
+            self.set_snapshot_async(False)
+            self.close_progress()
+            for tb_log in self._tb_logs.values():
+                tb_log.close()
+            self._tb_logs = {}
+
+    def _run(self, fn, *args):
+        if self._async_writer is None:
+            fn(*args)
+        else:
+            self._async_writer.submit(fn, *args)
+
     def save_itr_params(self, itr, params):
         if self._snapshot_dir:
-            if self._snapshot_mode == "all":
-                file_name = osp.join(self._snapshot_dir, "itr_{}.pkl".format(itr))
-                torch.save(params, file_name)
-            elif self._snapshot_mode == "last":
-                file_name = osp.join(self._snapshot_dir, "params.pkl")
-                torch.save(params, file_name)
-            elif self._snapshot_mode == "gap":
-                if itr % self._snapshot_gap == 0:
-                    file_name = osp.join(self._snapshot_dir, "itr_{}.pkl".format(itr))
-                    torch.save(params, file_name)
-            elif self._snapshot_mode == "gap_and_last":
-                if itr % self._snapshot_gap == 0:
-                    file_name = osp.join(self._snapshot_dir, "itr_{}.pkl".format(itr))
-                    torch.save(params, file_name)
-                file_name = osp.join(self._snapshot_dir, "params.pkl")
-                torch.save(params, file_name)
-            elif self._snapshot_mode == "none":
-                pass
+            file_names = self._snapshot_file_names(itr)
+            if not file_names:
+                return
+            if self._snapshot_writer is None:
+                self._save_params(itr, file_names, params)
             else:
-                raise NotImplementedError
+                # copy now, serialize and write on the snapshot thread
+                self._snapshot_writer.call(
+                    self._save_params, itr, file_names, snapshot_params(params)
+                )
+
+    def _snapshot_file_names(self, itr):
+        itr_file_name = osp.join(self._snapshot_dir, "itr_{}.pkl".format(itr))
+        last_file_name = osp.join(self._snapshot_dir, "params.pkl")
+        if self._snapshot_mode == "all":
+            return [itr_file_name]
+        elif self._snapshot_mode == "last":
+            return [last_file_name]
+        elif self._snapshot_mode == "gap":
+            if itr % self._snapshot_gap == 0:
+                return [itr_file_name]
+            return []
+        elif self._snapshot_mode == "gap_and_last":
+            if itr % self._snapshot_gap == 0:
+                return [itr_file_name, last_file_name]
+            return [last_file_name]
+        elif self._snapshot_mode == "none":
+            return []
+        else:
+            raise NotImplementedError
+
+    def _save_params(self, itr, file_names, params):
+        store = self._get_snapshot_store()
+        if store is not None:
+            itr_file_names = [
+                f for f in file_names if ITR_FILE_NAME.fullmatch(osp.basename(f))
+            ]
+            if itr_file_names:
+                store.save(itr, params)
+                file_names = [f for f in file_names if f not in itr_file_names]
+        if file_names:
+            import torch
+
+            # serialize once, whatever the number of targets
+            buffer = io.BytesIO()
+            torch.save(params, buffer)
+            data = buffer.getbuffer()
+            for file_name in file_names:
+                atomic_write(file_name, data)
+        if self._snapshot_keep_last is not None:
+            self._prune_snapshots()
+            if store is not None:
+                store.prune(self._snapshot_keep_last)
+
+    def _get_snapshot_store(self):
+        if self._snapshot_store_dir is None:
+            return None
+        root = osp.join(self._snapshot_dir, self._snapshot_store_dir)
+        if self._snapshot_store is None or self._snapshot_store.root != root:
+            self._snapshot_store = SnapshotStore(root)
+        return self._snapshot_store
+
+    def _prune_snapshots(self):
+        itrs = []
+        for file_name in os.listdir(self._snapshot_dir):
+            match = ITR_FILE_NAME.fullmatch(file_name)
+            if match:
+                itrs.append(int(match[1]))
+        itrs.sort()
+        for itr in itrs[: max(len(itrs) - self._snapshot_keep_last, 0)]:
+            os.remove(osp.join(self._snapshot_dir, "itr_{}.pkl".format(itr)))
+
+    def set_snapshot_async(self, enabled=True, max_pending=1):
+        """
+        Write snapshots on a background thread. save_itr_params only copies
+        the parameters, and blocks while max_pending snapshots are queued.
+        A failed write is raised by the next save_itr_params, flush or close.
+        """
+        if self._snapshot_writer is not None:
+            snapshot_writer, self._snapshot_writer = self._snapshot_writer, None
+            snapshot_writer.close()
+        if enabled:
+            self._snapshot_writer = AsyncWriter(max_pending, "block")
+            self._register_close_at_exit()
+
+    def set_snapshot_store(self, enabled=True, dir_name="snapshots"):
+        """
+        Save the itr_N snapshots in a toolbox.snapshot_store.SnapshotStore in
+        dir_name under the snapshot dir, which stores each tensor once
+        however many iterations use it. params.pkl is still a plain file.
+        """
+        self.flush()
+        self._snapshot_store_dir = dir_name if enabled else None
+        self._snapshot_store = None
+
+    def load_itr_params(self, itr, map_location=None):
+        """
+        Params saved by save_itr_params at iteration itr, from the snapshot
+        store if it is enabled.
+        """
+        store = self._get_snapshot_store()
+        if store is not None:
+            return store.load(itr, map_location)
+        import torch
+
+        file_name = osp.join(self._snapshot_dir, "itr_{}.pkl".format(itr))
+        return torch.load(file_name, map_location=map_location, weights_only=False)
+
+    def set_snapshot_keep_last(self, keep_last):
+        """
+        Only keep the keep_last most recent itr_N snapshots, None keeps all.
+        """
+        self._snapshot_keep_last = keep_last
 
     def log_variant(self, log_file, variant_data, resume=False):
         mkdir_p(os.path.dirname(log_file), erase_path=not resume)
         with open(log_file, "w") as f:
             f.write(yaml.dump(variant_data))
 
+    def set_progress_file(self, file_name, flush_every=1):
+        """
+        The extension of file_name selects the format, see
+        toolbox.progress.PROGRESS_WRITERS. With flush_every > 1, rows are
+        written in batches; pending rows are written at exit.
+        """
+        self.flush()
+        self.close_progress()
+        self._progress_file = file_name
+        self._progress_flush_every = flush_every
+
     def set_snapshot_dir(self, dir_name):
         self._snapshot_dir = dir_name
 
@@ -172,3 +515,4 @@ class Logger:
 
 
 logger = Logger()
+logger._register_close_at_exit()
@@ -1,30 +1,248 @@
 import glob
 import os
-from itertools import groupby
+import re
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from operator import attrgetter
 
 import numpy as np
 
-from tensorboard.backend.event_processing import event_accumulator
+from toolbox.progress import PROGRESS_WRITERS, read_progress
+from toolbox.scalar_cache import ScalarCache
+from toolbox.downsample import COLUMNS, SAMPLERS, make_sampler
+from toolbox.tfevents import iter_scalar_chunks, read_scalars
 
+READERS = ("accumulator", "native")
+# the types steps, wall times and values had when logs were built from lists
+SCALAR_DTYPE = np.dtype(
+    [("steps", np.int64), ("timestamps", np.float64), ("values", np.float64)]
+)
 
-def read_tensorboard(paths, log_keys, stats_key=None, filters_exp=None):
-    num_scalars = 1000
-    counter = {}
+
+def read_tensorboard(
+    paths,
+    log_keys,
+    stats_key=None,
+    filters_exp=None,
+    workers=None,
+    cache_dir=None,
+    reader="accumulator",
+    sampling="reservoir",
+    num_scalars=1000,
+    dtype=None,
+    worker_key=None,
+    band="minmax",
+    index=None,
+):
+    """
+    Read the log_keys scalars of the event files under paths and return
+    {log_key: {run_name: log}}. With worker_key and stats_key, runs are
+    aggregated over workers and over seeds, see aggregate_logs.
+    With index, a toolbox.index.EventIndex or the path of its database,
+    event files are listed by the index, updated first, and files holding
+    none of the log_keys are not opened.
+    """
+    if reader not in READERS:
+        raise ValueError(f"reader should be in {READERS}, got {reader}")
+    if sampling not in SAMPLERS:
+        raise ValueError(f"sampling should be in {tuple(SAMPLERS)}, got {sampling}")
+    if band not in BANDS:
+        raise ValueError(f"band should be in {BANDS}, got {band}")
+    if index is None:
+        log_files = find_log_files(paths, "*tfevents*", filters_exp)
+    else:
+        log_files = indexed_log_files(index, paths, log_keys, filters_exp)
+    files_logs = read_event_files(
+        [log_file for log_file, _ in log_files],
+        log_keys,
+        workers=workers,
+        cache_dir=cache_dir,
+        reader=reader,
+        sampling=sampling,
+        num_scalars=num_scalars,
+        dtype=dtype,
+    )
+    return build_runs(log_files, files_logs, stats_key, worker_key, num_scalars, band)
+
+
+def read_event_files(
+    files,
+    log_keys,
+    workers=None,
+    cache_dir=None,
+    reader="accumulator",
+    sampling="reservoir",
+    num_scalars=1000,
+    dtype=None,
+):
+    """
+    read_event_file on every file, in parallel if workers > 1. Results come
+    back in the order of files whatever the completion order of the workers.
+    Files left unread by a worker that died are read again on a new pool.
+    The scalar cache of cache_dir is evicted once, after every file is read.
+    """
     tf_size_guidance = {
         "compressedHistograms": 10,
         "images": 0,
-        "scalars": num_scalars,
+        # other samplings need every point from the accumulator
+        "scalars": num_scalars if sampling == "reservoir" else 0,
         "histograms": 1,
     }
+    load = partial(
+        read_event_file,
+        log_keys=log_keys,
+        tf_size_guidance=tf_size_guidance,
+        cache_dir=cache_dir,
+        reader=reader,
+        sampling=sampling,
+        num_scalars=num_scalars,
+        dtype=scalar_dtype(dtype),
+        evict_cache=False,
+    )
+    if workers is None or workers <= 1 or len(files) <= 1:
+        files_logs = [load(log_file) for log_file in files]
+    else:
+        files_logs = [None] * len(files)
+        pending = list(range(len(files)))
+        while pending:
+            pending = _read_in_pool(load, files, pending, workers, files_logs)
+            if pending:
+                print(f"WARNING: a worker died, reading {len(pending)} files again.")
+    if cache_dir is not None:
+        ScalarCache(cache_dir).evict()
+    return files_logs
+
+
+def _read_in_pool(load, files, pending, workers, files_logs):
+    """
+    Read the pending files of a pool into files_logs and return those that
+    were not read because the pool broke. If none was read, the pool broke
+    on its first files: each is then read in a pool of its own, so that a
+    file killing its worker is reported as unreadable.
+    """
+    broken = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(load, files[i]) for i in pending]
+        for i, future in zip(pending, futures):
+            try:
+                files_logs[i] = future.result()
+            except BrokenProcessPool as e:
+                broken.append(i)
+                error = e
+            except Exception as e:
+                files_logs[i] = _read_error(files[i], e)
+    if len(broken) < len(pending):
+        return broken
+    if len(pending) == 1:
+        files_logs[pending[0]] = _read_error(files[pending[0]], error)
+        return []
+    for i in broken:
+        _read_in_pool(load, files, [i], 1, files_logs)
+    return []
+
+
+def build_runs(
+    log_files,
+    files_logs,
+    stats_key=None,
+    worker_key=None,
+    num_scalars=1000,
+    band="minmax",
+):
+    """
+    {log_key: {run_name: log}} from the (log_file, root_path) of
+    find_log_files and the matching results of read_event_files, aggregated
+    over workers and seeds if worker_key and stats_key are given.
+    """
+    logs_flattened = defaultdict(lambda: {})
+    for (log_file, root_path), file_logs in zip(log_files, files_logs):
+        if file_logs is None:
+            continue
+        name = run_name(log_file, root_path)
+        for log_key, log in file_logs.items():
+            logs_flattened[log_key][name] = scalar_log(log)
+
+    for log_key, runs in logs_flattened.items():
+        # mean over the workers of a run, then statistics over its seeds
+        if worker_key is not None:
+            runs = aggregate_logs(runs, worker_key, num_scalars)
+        if stats_key is not None:
+            runs = aggregate_logs(runs, stats_key, num_scalars, band)
+        logs_flattened[log_key] = runs
+
+    return logs_flattened
+
+
+def read_progress_logs(paths, log_keys, filters_exp=None, step_key=None, dtype=None):
+    """
+    Same as read_tensorboard for the progress files written by
+    Logger.dump_log, in any format of progress.PROGRESS_WRITERS. Steps are
+    the values of step_key, or the record index when it is None; timestamps
+    come from the "timestamp/" entries.
+    """
+    dtype = scalar_dtype(dtype)
+    columns_keys = list(log_keys) + ["timestamp/"]
+    if step_key is not None:
+        columns_keys.append(step_key)
+
+    logs_flattened = defaultdict(lambda: {})
+    for log_file, root_path in find_progress_files(paths, filters_exp):
+        columns = read_progress(log_file, columns_keys)
+        timestamps = columns["timestamp/"]
+        if step_key is not None:
+            steps = columns[step_key]
+        else:
+            steps = np.arange(len(timestamps), dtype=np.float64)
+        name = run_name(log_file, root_path)
+        for log_key in log_keys:
+            values = columns[log_key]
+            keep = ~(np.isnan(values) | np.isnan(steps))
+            if not keep.any():
+                print(f"WARNING: did not find {log_key} in logs.")
+                continue
+            scalar = {
+                "steps": steps[keep],
+                "timestamps": timestamps[keep],
+                "values": values[keep],
+            }
+            logs_flattened[log_key][name] = scalar_log(_scalar_data(scalar, dtype))
+    return logs_flattened
+
+
+def find_progress_files(paths, filters_exp=None):
+    """
+    Sorted (log_file, root_path) of the progress files under each root path,
+    one per run directory: the first format of PROGRESS_WRITERS if a run
+    has several.
+    """
+    formats = list(PROGRESS_WRITERS)
+    runs = {}
+    for log_file, root_path in find_log_files(paths, "progress.*", filters_exp):
+        ext = os.path.splitext(log_file)[1]
+        if ext not in PROGRESS_WRITERS:
+            continue
+        run_dir = os.path.dirname(log_file)
+        kept = runs.get(run_dir)
+        if kept is None or formats.index(ext) < formats.index(
+            os.path.splitext(kept[0])[1]
+        ):
+            runs[run_dir] = (log_file, root_path)
+    return sorted(runs.values(), key=lambda x: x[0])
 
+
+def find_log_files(paths, pattern, filters_exp=None):
+    """
+    Sorted (log_file, root_path) of the files matching pattern under each
+    root path, keeping those containing one of filters_exp if given.
+    """
     # gather all the logfiles in the subdirectories
     log_files_raw = []
     for path in paths:
-        tb_files = glob.glob(os.path.join(path, "**/*tfevents*"), recursive=True)
-        tb_files = [(tb_file, path) for tb_file in tb_files]
-        log_files_raw += tb_files
+        files = glob.glob(os.path.join(path, "**", pattern), recursive=True)
+        log_files_raw += [(log_file, path) for log_file in files]
 
     # filter and keep log files related to a given log key or exp name
     if filters_exp is None:
@@ -39,100 +257,376 @@ def read_tensorboard(paths, log_keys, stats_key=None, filters_exp=None):
             log_files.append(log_file)
 
     log_files.sort(key=lambda x: x[0])
+    return log_files
 
-    logs = {}
-    for log_file, root_path in log_files:
-        logs[log_file] = {}
+
+def indexed_log_files(index, paths, log_keys=None, filters_exp=None):
+    """
+    find_log_files for event files from an EventIndex or its path, keeping
+    the files with at least one of log_keys.
+    """
+    from toolbox.index import EventIndex
+
+    if isinstance(index, EventIndex):
+        index.update(paths)
+        return index.query(paths, any_tags=log_keys, filters_exp=filters_exp)
+    with EventIndex(index) as event_index:
+        return indexed_log_files(event_index, paths, log_keys, filters_exp)
+
+
+def run_name(log_file, root_path):
+    rp = Path(root_path)
+    exp_name = Path(log_file).parent.name
+    name = exp_name
+    if exp_name != rp.name:
+        name = f"{rp.name}/{exp_name}"
+    return name
+
+
+def read_event_file(
+    log_file,
+    log_keys,
+    tf_size_guidance,
+    cache_dir=None,
+    reader="accumulator",
+    sampling="reservoir",
+    num_scalars=1000,
+    dtype=SCALAR_DTYPE,
+    evict_cache=True,
+):
+    """
+    Parse a single tfevents file and return {log_key: data} where data is a
+    structured array of the given dtype, or None if the file is corrupt or
+    truncated. Top-level so that it can be sent to workers.
+    With cache_dir or the native reader, scalars are read by toolbox.tfevents
+    and streamed through a toolbox.downsample sampler; the reservoir sampler
+    keeps exactly the points the EventAccumulator keeps. evict_cache=False
+    leaves the eviction of the cache to the caller, see read_event_files.
+    """
+    if cache_dir is not None or reader == "native":
+        return _read_native_event_file(
+            log_file, log_keys, cache_dir, sampling, num_scalars, dtype, evict_cache
+        )
+
+    # tensorboard is slow to import and only needed by this reader
+    from tensorboard.backend.event_processing import event_accumulator
+
+    try:
         event_acc = event_accumulator.EventAccumulator(log_file, tf_size_guidance)
         event_acc.Reload()
+    except Exception as e:
+        return _read_error(log_file, e)
 
-        tb_to_log_keys = {"wall_time": "timestamps", "step": "steps", "value": "values"}
-        tags = event_acc.Tags()
-        for log_key in log_keys:
-            if log_key not in tags["scalars"]:
-                print(f"WARNING: did not find {log_key} in logs.")
-                continue
-            scalar_logs = event_acc.Scalars(log_key)
-            logs[log_file][log_key] = {"timestamps": [], "steps": [], "values": []}
-            for scalar_log in scalar_logs:
-                for tb_log_key, user_log_key in tb_to_log_keys.items():
-                    logs[log_file][log_key][user_log_key].append(
-                        getattr(scalar_log, tb_log_key)
-                    )
-            for k, v in logs[log_file][log_key].items():
-                logs[log_file][log_key][k] = np.array(v).reshape(-1, 1)
-        logs[log_file]["root"] = root_path
+    logs = {}
+    log_to_tb_keys = {"timestamps": "wall_time", "steps": "step", "values": "value"}
+    scalar_fields = attrgetter(*(log_to_tb_keys[k] for k in dtype.names))
+    tags = event_acc.Tags()
+    for log_key in log_keys:
+        if log_key not in tags["scalars"]:
+            print(f"WARNING: did not find {log_key} in logs.")
+            continue
+        scalar_logs = event_acc.Scalars(log_key)
+        data = np.fromiter(
+            map(scalar_fields, scalar_logs), dtype=dtype, count=len(scalar_logs)
+        )
+        if sampling != "reservoir":
+            sampler = make_sampler(sampling, num_scalars)
+            sampler.update(*(data[k] for k in COLUMNS))
+            data = _scalar_data(sampler.result(), dtype)
+        logs[log_key] = data
+    return logs
 
-    logs_flattened = defaultdict(lambda: {})
-    for exp_path, exp_log in logs.items():
-        for log_key, log in exp_log.items():
-            if log_key == "root":
-                continue
-            rp = Path(exp_log["root"])
-            p = Path(exp_path)
-            exp_name = p.parent.name
-            if exp_name != rp.name:
-                name = f"{rp.name}/{exp_name}"
-            logs_flattened[log_key][name] = log
-
-    # compute mean over different workers
-    # worker_key = "/rank"
-    # grouped_logs = group_by_key(logs, worker_key)
-    # logs = align_logs_by_group(grouped_logs, num_scalars)
-    # average_values(logs)
-
-    # compute stats over different seeds
-    # grouped_logs = group_by_key(logs, stats_key)
-    # logs = align_logs_by_group(grouped_logs, num_scalars)
-    # statistics_values(logs)
 
-    return logs_flattened
+def _read_native_event_file(
+    log_file, log_keys, cache_dir, sampling, num_scalars, dtype, evict_cache=True
+):
+    samplers = {log_key: make_sampler(sampling, num_scalars) for log_key in log_keys}
+    try:
+        if cache_dir is not None:
+            chunks = [ScalarCache(cache_dir).load(log_file, evict_cache)]
+        else:
+            chunks = (chunk for _, chunk in iter_scalar_chunks(log_file, log_keys))
+        found = set()
+        for chunk in chunks:
+            for log_key, scalar in chunk.items():
+                if log_key in samplers:
+                    samplers[log_key].update(*(scalar[k] for k in COLUMNS))
+                    found.add(log_key)
+    except Exception as e:
+        return _read_error(log_file, e)
+
+    logs = {}
+    for log_key in log_keys:
+        if log_key not in found:
+            print(f"WARNING: did not find {log_key} in logs.")
+            continue
+        logs[log_key] = _scalar_data(samplers[log_key].result(), dtype)
+    return logs
+
+
+class EventFileTail:
+    """
+    Sampled scalars of an event file that keeps growing. update() only
+    parses the records appended since the previous call and feeds them to
+    one streaming sampler per log key; a file that shrank is read again.
+    """
+
+    def __init__(
+        self, log_file, log_keys, sampling="reservoir", num_scalars=1000, dtype=None
+    ):
+        self.log_file = log_file
+        self.log_keys = list(log_keys)
+        self.sampling = sampling
+        self.num_scalars = num_scalars
+        self.dtype = scalar_dtype(dtype)
+        self.failed = False
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self._samplers = {}
+
+    def update(self):
+        """
+        Read the new records, return the set of log keys that got points.
+        """
+        try:
+            if os.path.getsize(self.log_file) < self.offset:
+                self._reset()
+            scalars, self.offset = read_scalars(
+                self.log_file, self.log_keys, self.offset
+            )
+        except Exception as e:
+            _read_error(self.log_file, e)
+            self.failed = True
+            return set()
+        self.failed = False
+        for log_key, scalar in scalars.items():
+            if log_key not in self._samplers:
+                self._samplers[log_key] = make_sampler(self.sampling, self.num_scalars)
+            self._samplers[log_key].update(*(scalar[k] for k in COLUMNS))
+        return set(scalars)
+
+    def logs(self):
+        """
+        {log_key: data} like read_event_file, None if the file is unreadable.
+        """
+        if self.failed:
+            return None
+        return {
+            log_key: _scalar_data(sampler.result(), self.dtype)
+            for log_key, sampler in self._samplers.items()
+        }
+
+
+def scalar_dtype(dtype=None):
+    """
+    Structured dtype of a scalar log. dtype may be a full structured dtype
+    with steps, timestamps and values fields, or a dict overriding some of
+    the default columns, eg {"values": np.float32}.
+    """
+    if dtype is None:
+        return SCALAR_DTYPE
+    if isinstance(dtype, dict):
+        return np.dtype([(k, dtype.get(k, SCALAR_DTYPE[k])) for k in COLUMNS])
+    dtype = np.dtype(dtype)
+    if dtype.names is None or set(dtype.names) != set(COLUMNS):
+        raise ValueError(f"dtype should have the fields {COLUMNS}, got {dtype}")
+    return dtype
+
+
+def scalar_log(data):
+    """
+    Log dict of a structured array: steps, timestamps and values are (N, 1)
+    views on data, which is kept under the "data" key.
+    """
+    log = {k: data[k].reshape(-1, 1) for k in ("timestamps", "steps", "values")}
+    log["data"] = data
+    return log
+
+
+def _scalar_data(scalar, dtype):
+    data = np.empty(len(scalar["steps"]), dtype=dtype)
+    for k in COLUMNS:
+        data[k] = scalar[k]
+    return data
+
+
+def _read_error(log_file, e):
+    print(f"WARNING: could not read {log_file}, skipping it ({type(e).__name__}: {e}).")
+    return None
+
+
+def aggregate_logs(
+    logs,
+    group_key,
+    num_scalars=1000,
+    band=None,
+    quantiles=(0.25, 0.75),
+    confidence=0.95,
+    num_bootstrap=1000,
+):
+    """
+    Aggregate {run_name: log} over the runs grouped by group_key, see
+    group_by_key. The runs of a group are resampled on a shared grid of
+    num_scalars steps (the longest run length if 0) and their values
+    replaced by the mean, (N, 1), or with a band by the (N, 3) center, lower
+    and upper bounds that Lines draws as a shaded area, see band_values.
+    The log also gets "num_runs" and the "stats" of statistics_values.
+    Groups of a single run keep its raw log.
+    """
+    aggregated = {}
+    for group_name, group in group_by_key(logs, group_key).items():
+        if len(group) == 1:
+            aggregated[group_name] = next(iter(group.values()))
+            continue
+        aligned = align_logs(group, num_scalars)
+        if aligned is None:
+            print(f"WARNING: runs of {group_name} do not overlap, not aggregated.")
+            aggregated.update(group)
+            continue
+        steps, timestamps, values = aligned
+        if band is None:
+            center = values.mean(axis=0)[:, None]
+        else:
+            center = band_values(values, band, quantiles, confidence, num_bootstrap)
+        aggregated[group_name] = {
+            "steps": steps[:, None],
+            "timestamps": timestamps[:, None],
+            "values": center,
+            "num_runs": len(group),
+            "stats": statistics_values(values, quantiles),
+        }
+    return aggregated
+
+
+def group_by_key(logs, group_key):
+    """
+    Group {run_name: log} by the part of the run names before the first
+    match of the group_key regex, eg "exp/seed1" and "exp/seed2" for "/seed".
+    Runs whose name does not match are groups of their own.
+    Returns {group_name: {run_name: log}} sorted by name.
+    """
+    pattern = re.compile(group_key)
+    grouped = defaultdict(dict)
+    for name in sorted(logs):
+        match = pattern.search(name)
+        group_name = name[: match.start()] if match and match.start() else name
+        grouped[group_name][name] = logs[name]
+    return dict(grouped)
+
+
+def align_logs(logs, num_scalars):
+    """
+    Resample the runs of {run_name: log} on num_scalars steps spanning the
+    range they all cover, or None if they do not overlap. Returns the grid,
+    the mean wall time on it and the (num_runs, num_scalars) values.
+    """
+    runs = list(logs.values())
+    runs_steps = [log["steps"].reshape(-1) for log in runs]
+    start = max(steps.min() for steps in runs_steps)
+    end = min(steps.max() for steps in runs_steps)
+    if start > end:
+        return None
+    num_points = num_scalars or max(len(steps) for steps in runs_steps)
+    grid = np.linspace(start, end, num_points if end > start else 1)
+    columns = [
+        np.hstack((log["timestamps"].reshape(-1, 1), log["values"].reshape(-1, 1)))
+        for log in runs
+    ]
+    resampled = interp_runs(grid, runs_steps, columns)
+    return grid, resampled[:, :, 0].mean(axis=0), resampled[:, :, 1]
+
+
+def interp_runs(grid, runs_steps, runs_values):
+    """
+    np.interp of every run on grid in one batch. runs_values are (n_i, k)
+    arrays; returns a (num_runs, len(grid), k) array.
+    """
+    num_runs = len(runs_steps)
+    lengths = np.array([len(steps) for steps in runs_steps])
+    run_ids = np.repeat(np.arange(num_runs), lengths)
+    steps = np.concatenate(runs_steps).astype(np.float64)
+    values = np.concatenate(runs_values).astype(np.float64)
+    order = np.lexsort((steps, run_ids))
+    steps, values = steps[order], values[order]
+
+    # shift run i by i spans so that a single sorted array holds every run
+    # and one searchsorted finds the segment of each (run, grid step)
+    low = min(steps.min(), grid.min())
+    span = max(steps.max(), grid.max()) - low + 1
+    keys = steps - low + run_ids * span
+    queries = (grid - low)[None, :] + (np.arange(num_runs) * span)[:, None]
+    starts = np.cumsum(lengths) - lengths
+    ends = starts + lengths - 1
+    right = np.searchsorted(keys, queries, side="right")
+    right = np.minimum(np.maximum(right, starts[:, None] + 1), ends[:, None])
+    left = np.maximum(right - 1, starts[:, None])
+
+    x0, x1 = steps[left], steps[right]
+    width = x1 - x0
+    # clamped to the end values outside of a run, like np.interp
+    t = np.divide(grid - x0, width, out=np.zeros_like(x0), where=width > 0)
+    t = np.clip(t, 0, 1)[:, :, None]
+    return values[left] + t * (values[right] - values[left])
+
+
+BANDS = ("minmax", "std", "sem", "quantiles", "bootstrap")
+
+
+def band_values(
+    values, band="minmax", quantiles=(0.25, 0.75), confidence=0.95, num_bootstrap=1000
+):
+    """
+    (N, 3) center, lower and upper bound of (num_runs, N) values:
+    minmax: mean, min and max
+    std, sem: mean -/+ standard deviation or standard error of the mean
+    quantiles: median and the two quantiles
+    bootstrap: mean and its confidence interval
+    """
+    if band == "minmax":
+        bands = (values.mean(axis=0), values.min(axis=0), values.max(axis=0))
+    elif band in ("std", "sem"):
+        mean = values.mean(axis=0)
+        std = values.std(axis=0)
+        if band == "sem":
+            std = std / np.sqrt(len(values))
+        bands = (mean, mean - std, mean + std)
+    elif band == "quantiles":
+        low, median, high = np.quantile(values, (quantiles[0], 0.5, quantiles[1]), 0)
+        bands = (median, low, high)
+    elif band == "bootstrap":
+        low, high = bootstrap_ci(values, confidence, num_bootstrap)
+        bands = (values.mean(axis=0), low, high)
+    else:
+        raise ValueError(f"band should be in {BANDS}, got {band}")
+    return np.stack(bands, axis=1)
+
+
+def statistics_values(values, quantiles=(0.25, 0.75)):
+    """
+    Per step statistics across the runs of (num_runs, N) values.
+    """
+    stats = {
+        "mean": values.mean(axis=0),
+        "std": values.std(axis=0),
+        "min": values.min(axis=0),
+        "max": values.max(axis=0),
+    }
+    for q, v in zip(quantiles, np.quantile(values, quantiles, axis=0)):
+        stats[f"q{q:g}"] = v
+    return stats
 
 
-def group_by_key(d, group_key):
-    d_grouped = {}
-    groups = [list(i) for j, i in groupby(d.keys(), lambda a: a.split(group_key)[0])]
-    for group in groups:
-        group_name = group[0].split(group_key)[0]
-        for log_name in group:
-            if group_name not in d_grouped:
-                d_grouped[group_name] = []
-            d_grouped[group_name].append(d[log_name])
-    return d_grouped
-
-
-def align_logs_by_group(grouped_logs, num_scalars):
-    aligned_logs = {}
-    for group_name, group in grouped_logs.items():
-        steps_max = []
-        group_steps = []
-        group_values = []
-        for log in group:
-            group_steps.append(log["steps"])
-            group_values.append(log["values"])
-        steps_min = max([s.min() for s in group_steps])
-        steps_max = min([s.max() for s in group_steps])
-        steps = np.linspace(steps_min, steps_max, num_scalars)
-        for i in range(len(group_values)):
-            group_values[i] = np.interp(steps, group_steps[i], group_values[i])
-        group_values = np.stack(group_values)
-
-        aligned_logs[group_name] = {}
-        aligned_logs[group_name]["steps"] = steps
-        aligned_logs[group_name]["timestamps"] = log["timestamps"]
-        aligned_logs[group_name]["values"] = group_values
-    return aligned_logs
-
-
-def average_values(grouped_logs):
-    for group_name, group in grouped_logs.items():
-        v_mean = group["values"].mean(axis=0)
-        grouped_logs[group_name]["values"] = v_mean
-
-
-# def statistics_values(grouped_logs):
-#     for group_name, group in grouped_logs.items():
-#         v_mean = group["values"].mean(axis=0)[:, None]
-#         v_min = group["values"].min(axis=0)[:, None]
-#         v_max = group["values"].max(axis=0)[:, None]
-#         grouped_logs[group_name]["values"] = np.hstack((v_mean, v_min, v_max))
+def bootstrap_ci(values, confidence=0.95, num_bootstrap=1000, seed=0):
+    """
+    Percentile bootstrap confidence interval of the mean of (num_runs, N)
+    values. Each resample is a multinomial draw of run counts, so all the
+    resampled means are a single matrix product.
+    """
+    num_runs = len(values)
+    rng = np.random.default_rng(seed)
+    counts = rng.multinomial(num_runs, np.full(num_runs, 1 / num_runs), num_bootstrap)
+    means = counts @ values / num_runs
+    alpha = (1 - confidence) / 2
+    return np.quantile(means, (alpha, 1 - alpha), axis=0)
@@ -0,0 +1,172 @@
+import sys
+
+import numpy as np
+
+STATS = ("mean", "sum", "min", "max", "count")
+
+
+class MetricAccumulator:
+    """
+    Running sum, count, min and max of metrics added step after step, kept
+    in place in the framework of the values: torch tensors stay on their
+    device and are never synchronized by add(), other values go to numpy.
+
+    Each add() stacks the metrics of a device into one vector and updates
+    the buffers of the call's keys with a few vectorized operations, so
+    the number of kernels does not grow with the number of metrics. Tensors
+    with several elements contribute all of them. summary() converts to
+    Python floats with one copy per group of keys.
+    """
+
+    def __init__(self):
+        self._groups = {}
+
+    def add(self, metrics, prefix=""):
+        """
+        Accumulate a dict of scalars, tensors or arrays, the values of one
+        step. Keys are grouped under prefix.
+        """
+        torch = sys.modules.get("torch")
+        by_device = {}
+        for key, value in metrics.items():
+            if torch is not None and isinstance(value, torch.Tensor):
+                device = value.device
+            else:
+                device = None
+            keys, values = by_device.setdefault(device, ([], []))
+            keys.append(key)
+            values.append(value)
+        for device, (keys, values) in by_device.items():
+            group_key = (prefix, tuple(keys), device)
+            group = self._groups.get(group_key)
+            if group is None:
+                if device is None:
+                    group = _NumpyGroup(prefix, keys)
+                else:
+                    group = _TorchGroup(prefix, keys, device)
+                self._groups[group_key] = group
+            group.add(values)
+
+    def summary(self):
+        """
+        {prefix: {key: {stat: value}}} of the keys added since the last reset,
+        for the stats of STATS.
+        """
+        merged = {}
+        for group in self._groups.values():
+            sums, counts, mins, maxs = group.totals()
+            for i, key in enumerate(group.keys):
+                if counts[i] == 0:
+                    continue
+                stats = merged.setdefault(group.prefix, {}).get(key)
+                if stats is None:
+                    stats = merged[group.prefix][key] = {
+                        "sum": 0.0,
+                        "count": 0,
+                        "min": np.inf,
+                        "max": -np.inf,
+                    }
+                # a key may be in several groups, added by different calls
+                stats["sum"] += float(sums[i])
+                stats["count"] += int(counts[i])
+                stats["min"] = min(stats["min"], float(mins[i]))
+                stats["max"] = max(stats["max"], float(maxs[i]))
+        for metrics in merged.values():
+            for stats in metrics.values():
+                stats["mean"] = stats["sum"] / stats["count"]
+        return merged
+
+    def reset(self):
+        for group in self._groups.values():
+            group.reset()
+
+
+class _NumpyGroup:
+    def __init__(self, prefix, keys):
+        self.prefix = prefix
+        self.keys = keys
+        self._sums = np.zeros(len(keys))
+        self._counts = np.zeros(len(keys), dtype=np.int64)
+        self._mins = np.full(len(keys), np.inf)
+        self._maxs = np.full(len(keys), -np.inf)
+
+    def add(self, values):
+        try:
+            x = np.array(values, dtype=np.float64)
+        except ValueError:
+            x = None
+        if x is not None and x.ndim == 1:
+            self._sums += x
+            self._counts += 1
+            np.minimum(self._mins, x, out=self._mins)
+            np.maximum(self._maxs, x, out=self._maxs)
+            return
+        # arrays of several elements, reduced one by one
+        arrays = [np.asarray(v, dtype=np.float64) for v in values]
+        self._sums += [a.sum() for a in arrays]
+        self._counts += [a.size for a in arrays]
+        np.minimum(self._mins, [a.min() for a in arrays], out=self._mins)
+        np.maximum(self._maxs, [a.max() for a in arrays], out=self._maxs)
+
+    def totals(self):
+        return self._sums, self._counts, self._mins, self._maxs
+
+    def reset(self):
+        self._sums.fill(0)
+        self._counts.fill(0)
+        self._mins.fill(np.inf)
+        self._maxs.fill(-np.inf)
+
+
+class _TorchGroup:
+    def __init__(self, prefix, keys, device):
+        import torch
+
+        self.prefix = prefix
+        self.keys = keys
+        # float64 sums do not lose small steps, where the device supports it
+        dtype = torch.float32 if device.type == "mps" else torch.float64
+        # rows: sum, min, max
+        self._stats = torch.empty(3, len(keys), dtype=dtype, device=device)
+        self._counts = np.zeros(len(keys), dtype=np.int64)
+        self.reset()
+
+    def add(self, values):
+        import torch
+
+        with torch.no_grad():
+            if all(v.dim() == 0 for v in values):
+                x = torch.stack(values)
+            elif all(v.numel() == 1 for v in values):
+                x = torch.stack([v.reshape(()) for v in values])
+            else:
+                x = None
+            if x is not None:
+                x = x.to(self._stats.dtype)
+                self._stats[0].add_(x)
+                torch.minimum(self._stats[1], x, out=self._stats[1])
+                torch.maximum(self._stats[2], x, out=self._stats[2])
+                self._counts += 1
+                return
+            step = torch.stack(
+                [
+                    torch.stack([v.sum(), v.min(), v.max()]).to(self._stats.dtype)
+                    for v in values
+                ],
+                dim=1,
+            )
+            self._stats[0].add_(step[0])
+            torch.minimum(self._stats[1], step[1], out=self._stats[1])
+            torch.maximum(self._stats[2], step[2], out=self._stats[2])
+            self._counts += [v.numel() for v in values]
+
+    def totals(self):
+        # the only synchronization with the device
+        sums, mins, maxs = self._stats.cpu().numpy()
+        return sums, self._counts, mins, maxs
+
+    def reset(self):
+        self._stats[0].fill_(0)
+        self._stats[1].fill_(float("inf"))
+        self._stats[2].fill_(float("-inf"))
+        self._counts.fill(0)
@@ -35,6 +35,9 @@ def plot(
     logx,
     logy,
     xsteps=None,
+    smooth_kernel="ema",
+    dpi=300,
+    decimate=True,
 ):
     fig, ax = plt.subplots(figsize=figsize)
     if title:
@@ -48,7 +51,10 @@ def plot(
     for log_name, log in logs.items():
         steps, timestamps, values = log["steps"], log["timestamps"], log["values"]
         if xsteps:
-            steps = xsteps[log_name]["values"]
+            # x values of log_name at its steps, eg the epoch, which may be
+            # logged at other steps or aggregated on another grid
+            xlog = xsteps[log_name]
+            steps = np.interp(steps[:, 0], xlog["steps"][:, 0], xlog["values"][:, 0])
         # if timestamps is None:
         #     timestamps = np.zeros(2)
         #     assert xaxis != "time"
@@ -77,7 +83,20 @@ def plot(
         print("No experiments to plot.")
         return
 
-    plot_lines = Lines(resolution=resolution, smooth=smooth)
+    if xmin is None:
+        xmin = min(np.min(x) for x in domains)
+    if xmax is None:
+        xmax = max(np.max(x) for x in domains)
+    # points sharing a pixel column of the saved image are not drawn
+    num_pixels = int(figsize[0] * dpi) if decimate else None
+    plot_lines = Lines(
+        resolution=resolution,
+        smooth=smooth,
+        smooth_kernel=smooth_kernel,
+        num_pixels=num_pixels,
+        x_range=(xmin, xmax),
+        logx=logx,
+    )
     plot_lines.LEGEND["loc"] = legend["loc"]
     plot_lines.LEGEND["fontsize"] = legend["fontsize"]
     plot_lines.LEGEND["bbox_to_anchor"] = (
@@ -103,10 +122,6 @@ def plot(
     if logy:
         ax.set_yscale("log", nonposy="clip")
 
-    if xmin is None:
-        xmin = min(min(x) for x in domains)
-    if xmax is None:
-        xmax = max(max(x) for x in domains)
     ax.set_xlim(xmin, xmax)
     ax.set_ylim(vmin, vmax)
     # ax.xaxis.set_major_locator(plt.MaxNLocator(integer=True))
@@ -120,7 +135,7 @@ def plot(
     #     fig.tight_layout()
     img_path = output
     fig.savefig(
-        img_path, bbox_inches="tight", pad_inches=padding, transparent=False, dpi=300
+        img_path, bbox_inches="tight", pad_inches=padding, transparent=False, dpi=dpi
     )
     plt.close(fig)
 
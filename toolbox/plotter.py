@@ -1,45 +1,160 @@
-import matplotlib.pyplot as plt
+import os
+import time
+
 import numpy as np
 
 from toolbox import colors
 
 
 class Line:
-    def __init__(self, ax, label):
+    """
+    Live line whose points are stored in preallocated arrays grown
+    geometrically, or only the last window points if window is given.
+    """
+
+    def __init__(self, ax, label, window=None, capacity=1024):
         self.ax = ax
         self.line = None
-        self.data = {"x": [], "y": []}
         self.label = label
+        self.window = window
+        self.capacity = capacity
+        self.reset()
 
     def reset(self):
-        self.data = {"x": [], "y": []}
+        # in a window, point i is written at i % window and i % window + window
+        # so that the last window points are always a contiguous slice
+        size = 2 * self.window if self.window else self.capacity
+        self._x = np.empty(size)
+        self._y = np.empty(size)
+        self._start = 0
+        self._size = 0
+        self._count = 0
+        self._ymin = np.inf
+        self._ymax = -np.inf
+        self._stale_limits = False
+        self._stale_data = False
+
+    @property
+    def data(self):
+        points = slice(self._start, self._start + self._size)
+        return {"x": self._x[points], "y": self._y[points]}
 
     def min(self):
-        return (min(self.data["x"]), min(self.data["y"]))
+        self._update_limits()
+        return (self._x[self._start], self._ymin)
 
     def max(self):
-        return (max(self.data["x"]), max(self.data["y"]))
+        self._update_limits()
+        return (self._x[self._start + self._size - 1], self._ymax)
 
     def update(self, value):
-        ax = self.ax
-        self.data["y"] = self.data["y"] + [value]
-        self.data["x"] = np.arange(len(self.data["y"]))
+        if self.window is None:
+            if self._size == len(self._y):
+                self._grow()
+            self._x[self._size] = self._count
+            self._y[self._size] = value
+            self._size += 1
+        else:
+            slot = self._count % self.window
+            if self._size == self.window:
+                evicted = self._y[slot]
+                if evicted <= self._ymin or evicted >= self._ymax:
+                    self._stale_limits = True
+                self._start = (slot + 1) % self.window
+            else:
+                self._size += 1
+            self._x[slot] = self._x[slot + self.window] = self._count
+            self._y[slot] = self._y[slot + self.window] = value
+        self._count += 1
+        # comparisons with NaN are False, NaNs do not move the limits
+        if value < self._ymin:
+            self._ymin = value
+        if value > self._ymax:
+            self._ymax = value
+
         if self.line is None:
-            self.line = ax.plot(
+            self.line = self.ax.plot(
                 self.data["x"],
                 self.data["y"],
                 "r-",
                 color=colors.pop(),
                 label=self.label,
             )[0]
-            ax.legend()
+            self.ax.legend()
         else:
+            self._stale_data = True
+
+    def refresh(self):
+        """
+        Push the points to the matplotlib line, once per drawn frame.
+        """
+        if self._stale_data:
             self.line.set_data(self.data["x"], self.data["y"])
+            self._stale_data = False
+
+    def _update_limits(self):
+        if self._stale_limits:
+            y = self.data["y"]
+            self._ymin = np.fmin.reduce(y)
+            self._ymax = np.fmax.reduce(y)
+            self._stale_limits = False
+
+    def _grow(self):
+        for k in ("_x", "_y"):
+            array = getattr(self, k)
+            grown = np.empty(2 * len(array))
+            grown[: len(array)] = array
+            setattr(self, k, grown)
 
 
 class Plotter:
-    def __init__(self, rows, columns):
-        self.fig, self.axs = plt.subplots(rows, columns)
+    """
+    Grid of live lines and images.
+
+    Axis limits only change when the data leaves them, with a margin of
+    lim_factor - 1 times the data range. show() redraws the lines and images
+    over a cached background with blitting, and only redraws the whole
+    figure when limits, lines or the window size changed. Calls to show()
+    arriving faster than max_fps are skipped, and with skip_slow_frames, by
+    default without a sink, so are those that would spend more than half of
+    the time drawing. The last
+    update is then pending: it is drawn by the next show() that is not
+    skipped, or by flush(), e.g. when training stops or pauses.
+
+    With a sink, the figure is never shown: it is drawn offscreen on an Agg
+    canvas and each frame is copied into a reused (height, width, 3) uint8
+    array passed to sink.write(frame). The array is overwritten by the next
+    frame, sinks have to encode or copy it. Every show() writes a frame
+    unless max_fps is given, and close() writes the pending update before
+    closing the sink. See PngSequenceSink and toolbox.video.VideoWriter.
+    """
+
+    def __init__(
+        self,
+        rows,
+        columns,
+        window=None,
+        max_fps=None,
+        blit=True,
+        sink=None,
+        figsize=None,
+        dpi=None,
+        skip_slow_frames=None,
+    ):
+        self.sink = sink
+        if sink is None:
+            # pyplot loads a gui backend, offscreen plotters do without it
+            import matplotlib.pyplot as plt
+
+            self.fig, self.axs = plt.subplots(rows, columns, figsize=figsize, dpi=dpi)
+        else:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+
+            # no pyplot figure, nodes without a display have no gui backend
+            self.fig = Figure(figsize=figsize, dpi=dpi)
+            FigureCanvasAgg(self.fig)
+            self.axs = self.fig.subplots(rows, columns, squeeze=False)
         if rows == 1 and columns == 1:
             self.axs = np.array(self.axs).reshape(1, 1)
         elif columns == 1:
@@ -50,10 +165,30 @@ class Plotter:
         self.lines = {}
         self.ims = {}
         self.lim_factor = 1.1
+        self.window = window
+        self.max_fps = max_fps
+        self.blit = blit
+        # a sink, e.g. a video, gets every update
+        if skip_slow_frames is None:
+            skip_slow_frames = sink is None
+        self.skip_slow_frames = skip_slow_frames
+        self.num_skipped = 0
+        self.pending = False
+        self._limits = {}
+        self._background = None
+        self._needs_redraw = True
+        self._shown = False
+        self._last_render_end = -np.inf
+        self._render_time = 0.0
+        self._frame = None
+        self.fig.canvas.mpl_connect("draw_event", self._on_draw)
 
     def reset(self):
         self.lines = {}
         self.ims = {}
+        self._limits = {}
+        self._needs_redraw = True
+        self.pending = True
 
     def plot_line(self, value, label, ax_i=0, ax_j=0, ymin=None, ymax=None):
         ax = self.axs[ax_i, ax_j]
@@ -61,35 +196,164 @@ class Plotter:
         if ax_key not in self.lines:
             self.lines[ax_key] = {}
         if label not in self.lines[ax_key]:
-            line = Line(ax, label)
+            line = Line(ax, label, self.window)
             self.lines[ax_key][label] = line
         else:
             line = self.lines[ax_key][label]
         line.update(value)
+        self.pending = True
+        if line.line.get_animated() != self.blit:
+            line.line.set_animated(self.blit)
+            self._needs_redraw = True
+        self._update_limits(ax, ax_key, ymin, ymax)
 
+    def _update_limits(self, ax, ax_key, ymin, ymax):
         ax_lines = self.lines[ax_key].values()
-        vmin = np.vstack([line.min() for line in ax_lines]).min(axis=0)
-        vmax = np.vstack([line.max() for line in ax_lines]).max(axis=0)
+        vmin = np.array([min(v) for v in zip(*(line.min() for line in ax_lines))])
+        vmax = np.array([max(v) for v in zip(*(line.max() for line in ax_lines))])
+        limits = self._limits.get(ax_key)
+        if (
+            limits is not None
+            and limits[0] <= vmin[0]
+            and vmax[0] <= limits[1]
+            and (ymin is not None or limits[2] <= vmin[1])
+            and (ymax is not None or vmax[1] <= limits[3])
+            and (ymin is None or ymin == limits[2])
+            and (ymax is None or ymax == limits[3])
+        ):
+            return
+
         idx_scale = np.where(vmax <= vmin)
         vmax[idx_scale] = 1.1 * vmin[idx_scale] + 1e-5
-
-        lf = self.lim_factor
-        ax.set_xlim(lf * vmin[0], lf * vmax[0])
-        # ax.set_ylim(lf * vmin[1], lf * vmax[1])
+        margin = (self.lim_factor - 1) * (vmax - vmin)
+        xmin, xmax = vmin[0], vmax[0] + margin[0]
         if ymin is None:
-            ymin = lf * vmin[1]
+            ymin = vmin[1] - margin[1]
         if ymax is None:
-            ymax = lf * vmax[1]
+            ymax = vmax[1] + margin[1]
+        ax.set_xlim(xmin, xmax)
         ax.set_ylim(ymin, ymax)
+        self._limits[ax_key] = (xmin, xmax, ymin, ymax)
+        self._needs_redraw = True
 
     def plot_im(self, A, ax_i=0, ax_j=0, label="", **imshow_kwargs):
         ax = self.axs[ax_i, ax_j]
         ax_key = f"{ax_i}{ax_j}"
         if ax_key not in self.ims:
-            self.ims[ax_key] = ax.imshow(A, **imshow_kwargs)
+            self.ims[ax_key] = ax.imshow(A, animated=self.blit, **imshow_kwargs)
+            self._needs_redraw = True
         else:
             im = self.ims[ax_key]
             im.set_data(A)
+        self.pending = True
 
     def show(self, timeout=1e-5):
-        plt.pause(timeout)
+        start = time.perf_counter()
+        elapsed = start - self._last_render_end
+        # at most max_fps frames, and at most half of the time spent drawing
+        if (self.max_fps and elapsed < 1 / self.max_fps) or (
+            self.skip_slow_frames and elapsed < self._render_time
+        ):
+            self.num_skipped += 1
+            return
+        self._draw(timeout, start)
+
+    def flush(self, timeout=1e-5):
+        """
+        Draw the pending update that show() skipped, if any.
+        """
+        if self.pending:
+            self._draw(timeout, time.perf_counter())
+
+    def _draw(self, timeout, start):
+        self.pending = False
+        self._render(timeout)
+        self._last_render_end = time.perf_counter()
+        self._render_time = self._last_render_end - start
+
+    def _render(self, timeout):
+        for ax_lines in self.lines.values():
+            for line in ax_lines.values():
+                line.refresh()
+        canvas = self.fig.canvas
+        if self.sink is not None:
+            self._render_frame()
+            return
+        import matplotlib.pyplot as plt
+
+        if not self.blit or not canvas.supports_blit:
+            plt.pause(timeout)
+            return
+        if not self._shown:
+            plt.show(block=False)
+            self._shown = True
+        if self._needs_redraw or self._background is None:
+            # the draw event caches the background and draws the artists
+            canvas.draw()
+            self._needs_redraw = False
+        else:
+            canvas.restore_region(self._background)
+            self._draw_artists()
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def _render_frame(self):
+        canvas = self.fig.canvas
+        if not self.blit or self._needs_redraw or self._background is None:
+            canvas.draw()
+            self._needs_redraw = False
+        else:
+            canvas.restore_region(self._background)
+            self._draw_artists()
+        rgba = np.asarray(canvas.buffer_rgba())
+        if self._frame is None or self._frame.shape[:2] != rgba.shape[:2]:
+            self._frame = np.empty(rgba.shape[:2] + (3,), dtype=np.uint8)
+        np.copyto(self._frame, rgba[:, :, :3])
+        self.sink.write(self._frame)
+
+    @property
+    def frame(self):
+        """
+        Last frame sent to the sink.
+        """
+        return self._frame
+
+    def close(self):
+        if self.sink is not None:
+            self.flush()
+            self.sink.close()
+
+    def _on_draw(self, event):
+        if not self.blit:
+            return
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for ax_lines in self.lines.values():
+            for line in ax_lines.values():
+                self.fig.draw_artist(line.line)
+        for im in self.ims.values():
+            self.fig.draw_artist(im)
+
+
+class PngSequenceSink:
+    """
+    Frame sink writing frame_000000.png, frame_000001.png... in directory.
+    """
+
+    def __init__(self, directory, pattern="frame_{:06d}.png"):
+        self.directory = directory
+        self.pattern = pattern
+        self.num_frames = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, frame):
+        import matplotlib.image
+
+        path = os.path.join(self.directory, self.pattern.format(self.num_frames))
+        matplotlib.image.imsave(path, frame)
+        self.num_frames += 1
+
+    def close(self):
+        pass
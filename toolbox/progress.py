@@ -0,0 +1,426 @@
+import array
+import csv
+import io
+import json
+import os
+import struct
+
+import numpy as np
+import yaml
+
+# binary columnar blocks: magic, number of rows, number of columns, then the
+# rows x columns float64 values; column names live in a sidecar text file
+_BLOCK_HEADER = struct.Struct("<4sII")
+_BLOCK_MAGIC = b"TBPG"
+COLUMNS_SUFFIX = ".columns"
+INDEX_SUFFIX = ".index.npy"
+_YML_SEPARATOR = "§".encode("utf-8")
+# first characters of yaml lines or values the flat record parser leaves to yaml
+_YML_LINE_SPECIAL = set(" -'\"!&*[{|>?%@`#")
+_YML_VALUE_SPECIAL = set("'\"!&*[{|>")
+# yaml scalars float() does not parse, as _to_float reads them from yaml
+_YML_SCALARS = {
+    **dict.fromkeys(("true", "True", "TRUE", "yes", "Yes", "YES"), 1.0),
+    **dict.fromkeys(("on", "On", "ON"), 1.0),
+    **dict.fromkeys(("false", "False", "FALSE", "no", "No", "NO"), 0.0),
+    **dict.fromkeys(("off", "Off", "OFF"), 0.0),
+    **dict.fromkeys(("null", "Null", "NULL", "~", ".nan", ".NaN", ".NAN"), np.nan),
+    **dict.fromkeys((".inf", ".Inf", ".INF", "+.inf", "+.Inf", "+.INF"), np.inf),
+    **dict.fromkeys(("-.inf", "-.Inf", "-.INF"), -np.inf),
+}
+
+
+class ProgressWriter:
+    """
+    Append-only writer of the rows dumped by Logger.dump_log.
+
+    Columns get a stable index in order of first appearance. Rows are
+    buffered and written flush_every at a time.
+    """
+
+    def __init__(self, path, flush_every=1):
+        self.path = path
+        self.flush_every = flush_every
+        self.columns = []
+        self._column_index = {}
+        self._rows = []
+
+    def write(self, row):
+        for key in row:
+            if key not in self._column_index:
+                self._column_index[key] = len(self.columns)
+                self.columns.append(key)
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self._write_rows(self._rows)
+            self._rows = []
+
+    def close(self):
+        self.flush()
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+
+class YamlProgressWriter(ProgressWriter):
+    """
+    The historical progress.yml format: yaml documents separated by §.
+    """
+
+    def _write_rows(self, rows):
+        with open(self.path, "a") as f:
+            f.write("".join(yaml.dump(row) + "§" for row in rows))
+
+
+class JsonlProgressWriter(ProgressWriter):
+    def _write_rows(self, rows):
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(_to_json(row)) + "\n" for row in rows))
+
+
+class CsvProgressWriter(ProgressWriter):
+    """
+    Csv file whose header is the column index. Rows written before a column
+    appeared are shorter than the header; the header line is rewritten when
+    new columns show up, which only happens in the first dumps of a run.
+    """
+
+    def __init__(self, path, flush_every=1):
+        super().__init__(path, flush_every)
+        self._header = []
+        if os.path.exists(path):
+            with open(path, newline="") as f:
+                self._header = next(csv.reader(f), [])
+            for key in self._header:
+                self._column_index[key] = len(self.columns)
+                self.columns.append(key)
+
+    def _write_rows(self, rows):
+        if self.columns != self._header:
+            self._rewrite_header()
+        with open(self.path, "a", newline="") as f:
+            writer = csv.writer(f)
+            for row in rows:
+                writer.writerow([_to_json_value(row.get(k, "")) for k in self.columns])
+
+    def _rewrite_header(self):
+        body = ""
+        if os.path.exists(self.path):
+            with open(self.path, newline="") as f:
+                f.readline()
+                body = f.read()
+        header = io.StringIO()
+        csv.writer(header).writerow(self.columns)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", newline="") as f:
+            f.write(header.getvalue())
+            f.write(body)
+        os.replace(tmp_path, self.path)
+        self._header = list(self.columns)
+
+
+class ColumnarProgressWriter(ProgressWriter):
+    """
+    Binary file of float64 blocks, one block per flush. Values that are not
+    numbers are stored as NaN.
+    """
+
+    def __init__(self, path, flush_every=1):
+        super().__init__(path, flush_every)
+        self._columns_path = path + COLUMNS_SUFFIX
+        for key in _read_column_names(self._columns_path):
+            self._column_index[key] = len(self.columns)
+            self.columns.append(key)
+        self._num_saved_columns = len(self.columns)
+
+    def _write_rows(self, rows):
+        # names first, so that a block never refers to an unknown column
+        if len(self.columns) > self._num_saved_columns:
+            with open(self._columns_path, "a") as f:
+                f.write(
+                    "".join(k + "\n" for k in self.columns[self._num_saved_columns :])
+                )
+            self._num_saved_columns = len(self.columns)
+
+        block = np.full((len(rows), len(self.columns)), np.nan)
+        for i, row in enumerate(rows):
+            for key, value in row.items():
+                block[i, self._column_index[key]] = _to_float(value)
+        with open(self.path, "ab") as f:
+            f.write(_BLOCK_HEADER.pack(_BLOCK_MAGIC, *block.shape))
+            f.write(block.tobytes())
+
+
+PROGRESS_WRITERS = {
+    ".yml": YamlProgressWriter,
+    ".yaml": YamlProgressWriter,
+    ".jsonl": JsonlProgressWriter,
+    ".csv": CsvProgressWriter,
+    ".bin": ColumnarProgressWriter,
+}
+
+
+def make_progress_writer(path, flush_every=1):
+    """
+    Writer for path, picked from its extension.
+    """
+    ext = os.path.splitext(path)[1]
+    if ext not in PROGRESS_WRITERS:
+        raise ValueError(
+            f"progress file extension should be in {tuple(PROGRESS_WRITERS)}"
+        )
+    return PROGRESS_WRITERS[ext](path, flush_every)
+
+
+def read_progress(path, keys=None):
+    """
+    Read a progress file written by a ProgressWriter and return
+    {key: float64 array} with one entry per row, NaN where a row has no
+    value or a value that is not a number.
+    """
+    ext = os.path.splitext(path)[1]
+    readers = {
+        ".yml": read_progress_yml,
+        ".yaml": read_progress_yml,
+        ".jsonl": _read_jsonl,
+        ".csv": _read_csv,
+        ".bin": _read_columnar,
+    }
+    if ext not in readers:
+        raise ValueError(f"cannot read progress files with extension {ext}")
+    return readers[ext](path, keys)
+
+
+def iter_progress_yml(path):
+    """
+    Yield (record_index, dict) for every record of a progress.yml file,
+    reading it one record at a time.
+    """
+    for index, (_, record) in enumerate(_iter_yml_records(path)):
+        yield index, _load_yml_record(record)
+
+
+def read_progress_yml(path, keys=None):
+    """
+    Build {key: float64 array} columns from a progress.yml file in one pass,
+    NaN where a record has no value or a value that is not a number. With
+    keys=None every key found in the file gets a column.
+    """
+    columns = {}
+    num_records = 0
+    for _, record in _iter_yml_records(path):
+        row = _parse_flat_yml_record(record)
+        if row is None:
+            row = {k: _to_float(v) for k, v in _load_yml_record(record).items()}
+        for key, value in row.items():
+            if keys is not None and key not in keys:
+                continue
+            if key not in columns:
+                columns[key] = array.array("d", [np.nan] * num_records)
+            columns[key].append(value)
+        num_records += 1
+        for column in columns.values():
+            if len(column) < num_records:
+                column.append(np.nan)
+    if keys is None:
+        keys = list(columns)
+    return {
+        k: (
+            np.frombuffer(columns[k], dtype=np.float64)
+            if k in columns
+            else np.full(num_records, np.nan)
+        )
+        for k in keys
+    }
+
+
+def write_progress_index(path, index_path=None):
+    """
+    Save the (offset, length) in bytes of every record of a progress.yml
+    file, for read_progress_record. Returns the index path.
+    """
+    if index_path is None:
+        index_path = path + INDEX_SUFFIX
+    index = [(offset, len(record)) for offset, record in _iter_yml_records(path)]
+    index = np.array(index, dtype=np.int64).reshape(-1, 2)
+    with open(index_path, "wb") as f:
+        np.save(f, index)
+    return index_path
+
+
+def read_progress_record(path, record_index, index_path=None):
+    """
+    Random access to one record of a progress.yml file through the index of
+    write_progress_index.
+    """
+    if index_path is None:
+        index_path = path + INDEX_SUFFIX
+    index = np.load(index_path, mmap_mode="r")
+    offset, length = index[record_index]
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return _load_yml_record(f.read(length))
+
+
+def _iter_yml_records(path, chunk_size=1 << 20):
+    """
+    Yield (offset, bytes) for every non empty record of a progress.yml file.
+    """
+    offset = 0
+    pending = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            pending += chunk
+            records = pending.split(_YML_SEPARATOR)
+            # the last piece may be cut in the middle of a record
+            pending = records.pop() if chunk else b""
+            for record in records:
+                if record.strip():
+                    yield offset, record
+                offset += len(record) + len(_YML_SEPARATOR)
+            if not chunk:
+                if pending.strip():
+                    yield offset, pending
+                return
+
+
+class _ProgressYamlLoader(getattr(yaml, "CSafeLoader", yaml.SafeLoader)):
+    pass
+
+
+# values dumped as python objects (tensors, numpy scalars...) are not rebuilt
+_ProgressYamlLoader.add_multi_constructor(
+    "tag:yaml.org,2002:python/", lambda loader, suffix, node: None
+)
+
+
+def _load_yml_record(record):
+    return yaml.load(record.decode("utf-8"), Loader=_ProgressYamlLoader) or {}
+
+
+def _parse_flat_yml_record(record):
+    """
+    Fast path for records that are flat "key: value" lines, which is what
+    yaml.dump writes for a dict of numbers; None for anything else. Values
+    are the floats the yaml path gives, _to_float of the loaded record:
+
+    >>> record = b"done: true\\nloss: 0.5\\nskip: null\\nstep: 3\\n"
+    >>> _parse_flat_yml_record(record)
+    {'done': 1.0, 'loss': 0.5, 'skip': nan, 'step': 3.0}
+    >>> {k: _to_float(v) for k, v in _load_yml_record(record).items()}
+    {'done': 1.0, 'loss': 0.5, 'skip': nan, 'step': 3.0}
+    """
+    row = {}
+    for line in record.decode("utf-8").splitlines():
+        if not line:
+            continue
+        key, sep, value = line.partition(": ")
+        if not sep or line[0] in _YML_LINE_SPECIAL or value[:1] in _YML_VALUE_SPECIAL:
+            return None
+        row[key] = _YML_SCALARS[value] if value in _YML_SCALARS else _to_float(value)
+    return row
+
+
+def _read_columnar(path, keys):
+    columns = _read_column_names(path + COLUMNS_SUFFIX)
+    buf = np.fromfile(path, dtype=np.uint8)
+    blocks = []
+    offset = 0
+    while offset + _BLOCK_HEADER.size <= len(buf):
+        magic, num_rows, num_columns = _BLOCK_HEADER.unpack_from(buf, offset)
+        offset += _BLOCK_HEADER.size
+        count = num_rows * num_columns
+        if magic != _BLOCK_MAGIC or offset + 8 * count > len(buf):
+            # truncated last block of a run that was killed mid-write
+            break
+        block = np.frombuffer(buf, dtype=np.float64, count=count, offset=offset)
+        blocks.append(block.reshape(num_rows, num_columns))
+        offset += 8 * count
+
+    table = np.full((sum(len(b) for b in blocks), len(columns)), np.nan)
+    row = 0
+    for block in blocks:
+        table[row : row + len(block), : block.shape[1]] = block
+        row += len(block)
+    return _select(columns, table, keys)
+
+
+def _read_csv(path, keys):
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        columns = next(reader, [])
+        # rows written before a column appeared are shorter than the header
+        rows = [row + [""] * (len(columns) - len(row)) for row in reader]
+    cells = np.array(rows, dtype=str).reshape(len(rows), len(columns))
+    cells[cells == ""] = "nan"
+    table = np.empty(cells.shape)
+    for j in range(len(columns)):
+        try:
+            table[:, j] = cells[:, j].astype(np.float64)
+        except ValueError:
+            table[:, j] = [_to_float(value) for value in cells[:, j]]
+    return _select(columns, table, keys)
+
+
+def _read_jsonl(path, keys):
+    columns = {}
+    rows = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            for key in row:
+                columns.setdefault(key, len(columns))
+            rows.append(row)
+    table = np.full((len(rows), len(columns)), np.nan)
+    for i, row in enumerate(rows):
+        for key, value in row.items():
+            table[i, columns[key]] = _to_float(value)
+    return _select(list(columns), table, keys)
+
+
+def _select(columns, table, keys):
+    if keys is None:
+        keys = columns
+    index = {k: i for i, k in enumerate(columns)}
+    return {
+        k: table[:, index[k]] if k in index else np.full(len(table), np.nan)
+        for k in keys
+    }
+
+
+def _read_column_names(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _to_json(row):
+    return {k: _to_json_value(v) for k, v in row.items()}
+
+
+def _to_json_value(value):
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, "item"):
+        try:
+            return value.item()
+        except (ValueError, RuntimeError):
+            pass
+    return str(value)
@@ -0,0 +1,314 @@
+import hashlib
+import os
+from collections import defaultdict
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from toolbox.logs_util import find_log_files, run_name
+from toolbox.tfevents import DEFAULT_CHUNK_SIZE, CorruptRecordError, iter_scalar_chunks
+
+# per bucket statistics of a level
+BUCKET_DTYPE = np.dtype(
+    [
+        ("count", np.int64),
+        ("sum", np.float64),
+        ("sum_steps", np.float64),
+        ("min", np.float64),
+        ("max", np.float64),
+        ("last", np.float64),
+        ("last_step", np.int64),
+        ("last_timestamp", np.float64),
+    ]
+)
+_MIN_CAPACITY = 1024
+
+
+class BucketPyramid:
+    """
+    Count, mean, min, max and last value of a scalar series in buckets of
+    fixed step widths base_width * factor ** level, updated chunk by chunk
+    in a single pass. Each chunk is reduced once to its finest buckets,
+    which are reduced again for each coarser level.
+
+    Memory grows with the number of buckets, not of points. With spill_dir,
+    levels are .npy files memory-mapped from spill_dir, which the OS pages
+    out, and that can be reopened with open_pyramid. Without it, levels of
+    more than max_buckets buckets are dropped, the finest ones first.
+    NaN values are skipped.
+    """
+
+    def __init__(
+        self,
+        base_width=1,
+        factor=4,
+        num_levels=10,
+        spill_dir=None,
+        max_buckets=1 << 16,
+    ):
+        if base_width < 1 or factor < 2:
+            raise ValueError("base_width should be >= 1 and factor >= 2")
+        self.widths = [base_width * factor**level for level in range(num_levels)]
+        self.factor = factor
+        self.spill_dir = spill_dir
+        self.max_buckets = max_buckets
+        self.num_points = 0
+        # buckets[level] holds buckets [0, num_buckets[level])
+        self.buckets = [None] * num_levels
+        self.num_buckets = [0] * num_levels
+        self.dropped = [False] * num_levels
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def update(self, steps, timestamps, values):
+        valid = ~np.isnan(values)
+        if not valid.all():
+            steps, timestamps, values = steps[valid], timestamps[valid], values[valid]
+        if len(steps) == 0:
+            return
+        if steps.min() < 0:
+            raise ValueError("steps should be non-negative")
+        self.num_points += len(steps)
+        partial = _reduce(
+            steps // self.widths[0],
+            {
+                "count": np.ones(len(steps), dtype=np.int64),
+                "sum": values.astype(np.float64),
+                "sum_steps": steps.astype(np.float64),
+                "min": values.astype(np.float64),
+                "max": values.astype(np.float64),
+                "last": values.astype(np.float64),
+                "last_step": steps.astype(np.int64),
+                "last_timestamp": timestamps.astype(np.float64),
+            },
+        )
+        for level in range(len(self.widths)):
+            if level > 0:
+                ids, columns = partial
+                partial = _reduce(ids // self.factor, columns)
+            self._merge(level, *partial)
+
+    def _merge(self, level, ids, columns):
+        if self.dropped[level]:
+            return
+        size = int(ids[-1]) + 1
+        if size > self.num_buckets[level]:
+            if not self._reserve(level, size):
+                return
+            self.num_buckets[level] = size
+        buckets = self.buckets[level]
+        stored = buckets[ids]
+        stored["count"] += columns["count"]
+        stored["sum"] += columns["sum"]
+        stored["sum_steps"] += columns["sum_steps"]
+        np.minimum(stored["min"], columns["min"], out=stored["min"])
+        np.maximum(stored["max"], columns["max"], out=stored["max"])
+        # chunks come in file order, the last value of a chunk is the latest
+        for k in ("last", "last_step", "last_timestamp"):
+            stored[k] = columns[k]
+        buckets[ids] = stored
+
+    def _reserve(self, level, size):
+        buckets = self.buckets[level]
+        if buckets is not None and size <= len(buckets):
+            return True
+        if self.spill_dir is None and size > self.max_buckets:
+            self.buckets[level] = None
+            self.dropped[level] = True
+            return False
+        capacity = max(size, 2 * (0 if buckets is None else len(buckets)))
+        capacity = max(capacity, _MIN_CAPACITY)
+        if self.spill_dir is None:
+            grown = np.empty(capacity, dtype=BUCKET_DTYPE)
+        else:
+            grown = open_memmap(
+                self._level_path(level, capacity),
+                mode="w+",
+                dtype=BUCKET_DTYPE,
+                shape=(capacity,),
+            )
+        grown[:] = _EMPTY_BUCKET
+        if buckets is not None:
+            grown[: self.num_buckets[level]] = buckets[: self.num_buckets[level]]
+            if self.spill_dir is not None:
+                path = buckets.filename
+                del buckets
+                os.remove(path)
+        self.buckets[level] = grown
+        return True
+
+    def _level_path(self, level, capacity):
+        return os.path.join(self.spill_dir, f"level{level}_{capacity}.npy")
+
+    def level(self, level):
+        """
+        Structured array of the non-empty buckets of a level.
+        """
+        if self.buckets[level] is None:
+            return np.empty(0, dtype=BUCKET_DTYPE)
+        buckets = self.buckets[level][: self.num_buckets[level]]
+        return buckets[buckets["count"] > 0]
+
+    def select_level(self, num_points=1000):
+        """
+        Finest level with at most num_points non-empty buckets, or the
+        coarsest one.
+        """
+        for level in range(len(self.widths)):
+            if self.buckets[level] is None:
+                continue
+            buckets = self.buckets[level][: self.num_buckets[level]]
+            if np.count_nonzero(buckets["count"]) <= num_points:
+                return level
+        return len(self.widths) - 1
+
+    def log(self, num_points=1000, level=None):
+        """
+        Log of a level, select_level by default, that toolbox.plot.plot
+        draws directly: (N, 1) mean steps and last timestamps and (N, 3)
+        mean, min and max values, drawn as a line and its band. The bucket
+        statistics are under "buckets".
+        """
+        if level is None:
+            level = self.select_level(num_points)
+        buckets = self.level(level)
+        count = buckets["count"]
+        mean = buckets["sum"] / count
+        return {
+            "steps": (buckets["sum_steps"] / count)[:, None],
+            "timestamps": buckets["last_timestamp"][:, None],
+            "values": np.stack((mean, buckets["min"], buckets["max"]), axis=1),
+            "buckets": {
+                "count": count,
+                "mean": mean,
+                "min": buckets["min"],
+                "max": buckets["max"],
+                "last": buckets["last"],
+                "last_step": buckets["last_step"],
+                "width": self.widths[level],
+            },
+        }
+
+    def flush(self):
+        if self.spill_dir is not None:
+            for buckets in self.buckets:
+                if buckets is not None:
+                    buckets.flush()
+
+
+_EMPTY_BUCKET = np.array(
+    (0, 0.0, 0.0, np.inf, -np.inf, np.nan, -1, np.nan), dtype=BUCKET_DTYPE
+)
+
+
+def _reduce(ids, columns):
+    """
+    (bucket ids, columns) of the buckets of ids, in file order within a
+    bucket: count, sums, min and max are reduced, last* take the last one.
+    """
+    if len(ids) > 1 and (ids[1:] < ids[:-1]).any():
+        # steps going back, e.g. a resumed run: stable to keep file order
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        columns = {k: v[order] for k, v in columns.items()}
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)] - 1
+    reduced = {
+        "count": np.add.reduceat(columns["count"], starts),
+        "sum": np.add.reduceat(columns["sum"], starts),
+        "sum_steps": np.add.reduceat(columns["sum_steps"], starts),
+        "min": np.minimum.reduceat(columns["min"], starts),
+        "max": np.maximum.reduceat(columns["max"], starts),
+    }
+    for k in ("last", "last_step", "last_timestamp"):
+        reduced[k] = columns[k][ends]
+    return ids[starts], reduced
+
+
+def open_pyramid(spill_dir):
+    """
+    {level: buckets} of the levels spilled in spill_dir, read-only memmaps
+    of BUCKET_DTYPE, including the empty buckets past the last one filled.
+    """
+    levels = {}
+    for file_name in os.listdir(spill_dir):
+        if file_name.startswith("level") and file_name.endswith(".npy"):
+            level = int(file_name[len("level") :].split("_")[0])
+            levels[level] = np.load(os.path.join(spill_dir, file_name), mmap_mode="r")
+    return levels
+
+
+def read_pyramids(
+    paths,
+    log_keys,
+    filters_exp=None,
+    base_width=1,
+    factor=4,
+    num_levels=10,
+    spill_dir=None,
+    max_buckets=1 << 16,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+):
+    """
+    {log_key: {run_name: BucketPyramid}} of the event files under paths,
+    each read once, chunk by chunk, so that memory only holds a chunk of
+    records and the pyramids. With spill_dir, the levels of each file and
+    tag are spilled to a subdirectory of spill_dir. Files that cannot be
+    read are skipped; invalid steps, such as negative ones, are raised.
+    """
+    pyramids = defaultdict(dict)
+    for log_file, root_path in find_log_files(paths, "*tfevents*", filters_exp):
+        name = run_name(log_file, root_path)
+        file_pyramids = {}
+        chunks = iter_scalar_chunks(log_file, log_keys, 0, chunk_size)
+        while True:
+            # only reading is guarded, errors of update are data problems
+            try:
+                _, chunk = next(chunks)
+            except StopIteration:
+                break
+            except (OSError, CorruptRecordError) as e:
+                print(f"WARNING: could not read {log_file}, skipping it ({e}).")
+                file_pyramids = None
+                break
+            for log_key, scalar in chunk.items():
+                if log_key not in file_pyramids:
+                    file_pyramids[log_key] = BucketPyramid(
+                        base_width,
+                        factor,
+                        num_levels,
+                        _spill_subdir(spill_dir, log_file, log_key),
+                        max_buckets,
+                    )
+                try:
+                    file_pyramids[log_key].update(
+                        scalar["steps"], scalar["timestamps"], scalar["values"]
+                    )
+                except ValueError as e:
+                    raise ValueError(f"{log_key} of {log_file}: {e}") from e
+        if file_pyramids is None:
+            continue
+        for log_key, pyramid in file_pyramids.items():
+            pyramid.flush()
+            pyramids[log_key][name] = pyramid
+    for log_key in log_keys:
+        if log_key not in pyramids:
+            print(f"WARNING: did not find {log_key} in logs.")
+    return pyramids
+
+
+def pyramid_logs(pyramids, num_points=1000):
+    """
+    {log_key: {run_name: log}} of read_pyramids, for toolbox.plot.plot.
+    """
+    return {
+        log_key: {name: pyramid.log(num_points) for name, pyramid in runs.items()}
+        for log_key, runs in pyramids.items()
+    }
+
+
+def _spill_subdir(spill_dir, log_file, log_key):
+    if spill_dir is None:
+        return None
+    key = f"{os.path.abspath(log_file)}:{log_key}".encode("utf-8")
+    return os.path.join(spill_dir, hashlib.sha1(key).hexdigest())
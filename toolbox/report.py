@@ -1,22 +1,31 @@
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import click
 import numpy as np
 import yaml
-from termcolor import colored
 
 
-from toolbox.logs_util import read_tensorboard
-from toolbox.plot import plot
+from toolbox.downsample import SAMPLERS
+from toolbox.index import EventIndex
+from toolbox.logs_util import (
+    BANDS,
+    READERS,
+    EventFileTail,
+    build_runs,
+    find_log_files,
+    indexed_log_files,
+    read_event_files,
+)
+from toolbox.scalar_cache import ScalarCache
 from toolbox.settings import BASE_DIR
-
-
-def load_runs(logs_paths, keys, stats_key, filters_exp):
-    logs = read_tensorboard(logs_paths, keys, stats_key, filters_exp)
-    return logs
+from toolbox.watch import watch_files
 
 
 def print_color(s, color):
+    from termcolor import colored
+
     print(colored(s, color))
 
 
@@ -35,19 +44,13 @@ def report_values(log_key, logs, factor=1, max_value=False):
         )
 
 
-@click.command()
-@click.argument("experiment", type=str, required=True)
-@click.option("--stats-key", "-sk", type=str, default="/seed")
-def main(experiment, stats_key):
-    plot_dict = yaml.load(
-        open(os.path.join(BASE_DIR, "experiments", "plot.yml"), "r"),
-        Loader=yaml.FullLoader,
-    )
-    exp_dict = yaml.load(
-        open(os.path.join(BASE_DIR, "experiments", experiment), "r"),
-        Loader=yaml.FullLoader,
-    )
-    savedir = plot_dict.pop("savedir")
+def plan_report(exp_dict, index=None):
+    """
+    (plot_name, paths, labels, log_files) of every entry of an experiment file,
+    where log_files are the (log_file, root_path) of find_log_files, or of
+    the EventIndex index.
+    """
+    entries = []
     for exp_paths, plot_name, labels, filters_exp in zip(
         exp_dict["paths"],
         exp_dict["plot_name"],
@@ -60,32 +63,294 @@ def main(experiment, stats_key):
                 "paths:\n"
                 "- - /path_to_experiment"
             )
-        print("Processing {} located in {} ...".format(plot_name, exp_paths))
-        log_keys = list(exp_dict["log_keys"].keys()) + ["trainer/epoch"]
-        logs = load_runs(exp_paths, log_keys, stats_key, filters_exp)
-
-        epochs = logs.pop("trainer/epoch")
-        for log_key, log_prop in exp_dict["log_keys"].items():
-            log_plot_dict = plot_dict.copy()
-            log_plot_dict["labels"] = labels
-            if log_prop["label"]:
-                log_plot_dict["ylabel"] = log_prop["label"]
+        if index is None:
+            log_files = find_log_files(exp_paths, "*tfevents*", filters_exp)
+        else:
+            log_keys = list(exp_dict["log_keys"]) + ["trainer/epoch"]
+            log_files = indexed_log_files(index, exp_paths, log_keys, filters_exp)
+        entries.append((plot_name, exp_paths, labels, log_files))
+    return entries
+
+
+def entry_figures(
+    entry,
+    files_logs,
+    exp_dict,
+    plot_dict,
+    savedir,
+    stats_key,
+    worker_key,
+    num_scalars,
+    band,
+    log_keys=None,
+):
+    """
+    plot() arguments of the figures of an entry of plan_report, from the
+    results of read_event_files on its log files. With log_keys, only the
+    figures of these keys are built.
+    """
+    plot_name, exp_paths, labels, log_files = entry
+    if log_keys is not None:
+        keys = set(log_keys) | {"trainer/epoch"}
+        files_logs = [
+            None if logs is None else {k: v for k, v in logs.items() if k in keys}
+            for logs in files_logs
+        ]
+    print("Processing {} located in {} ...".format(plot_name, exp_paths))
+    logs = build_runs(log_files, files_logs, stats_key, worker_key, num_scalars, band)
+
+    figures = []
+    epochs = logs.pop("trainer/epoch")
+    for log_key, log_prop in exp_dict["log_keys"].items():
+        if log_keys is not None and log_key not in log_keys:
+            continue
+        log_plot_dict = plot_dict.copy()
+        log_plot_dict["labels"] = labels
+        if log_prop["label"]:
+            log_plot_dict["ylabel"] = log_prop["label"]
+        else:
+            log_plot_dict["ylabel"] = log_key
+        log_plot_dict["output"] = os.path.join(
+            savedir, "{}_{}.png".format(plot_name, log_prop["filename"])
+        )
+        log_plot_dict["xsteps"] = epochs
+        log_plot_dict["logs"] = logs[log_key]
+        factor = 1
+        if "Success" in log_key or "Accuracy" in log_key:
+            factor = 100
+        max_value = False
+        report_values(log_key, logs[log_key], factor, max_value)
+        if log_prop["kwargs"]:
+            log_plot_dict.update(log_prop["kwargs"])
+        figures.append(log_plot_dict)
+    return figures
+
+
+def watch_report(
+    exp_dict,
+    plot_dict,
+    savedir,
+    log_keys,
+    stats_key,
+    worker_key,
+    num_scalars,
+    band,
+    sampling,
+    render_workers,
+    interval,
+    debounce,
+    index=None,
+):
+    """
+    Render the report, then re-render the figures whose inputs changed
+    whenever event files are created or grow. Only the records appended to
+    a file since the last refresh are read, see EventFileTail.
+    """
+    tails = {}
+    planned = {}
+
+    def list_files():
+        entries = plan_report(exp_dict, index)
+        return [f for *_, log_files in entries for f, _ in log_files]
+
+    def refresh(changed):
+        start = time.perf_counter()
+        updated = {}
+        for log_file in changed:
+            if not os.path.exists(log_file):
+                tails.pop(log_file, None)
+                continue
+            if log_file not in tails:
+                tails[log_file] = EventFileTail(
+                    log_file, log_keys, sampling, num_scalars
+                )
+            updated[log_file] = tails[log_file].update()
+
+        figures = []
+        for entry in plan_report(exp_dict, index):
+            plot_name, _, _, log_files = entry
+            files = [log_file for log_file, _ in log_files]
+            keys = set().union(*(updated.get(f, set()) for f in files))
+            if planned.get(plot_name) != files or "trainer/epoch" in keys:
+                # new or removed runs, or new epochs: every figure moves
+                entry_keys = None
             else:
-                log_plot_dict["ylabel"] = log_key
-            log_plot_dict["output"] = os.path.join(
-                savedir, "{}_{}.png".format(plot_name, log_prop["filename"])
+                entry_keys = keys & set(exp_dict["log_keys"])
+                if not entry_keys:
+                    continue
+            planned[plot_name] = files
+            files_logs = [tails[f].logs() if f in tails else None for f in files]
+            figures += entry_figures(
+                entry,
+                files_logs,
+                exp_dict,
+                plot_dict,
+                savedir,
+                stats_key,
+                worker_key,
+                num_scalars,
+                band,
+                entry_keys,
             )
-            log_plot_dict["xsteps"] = epochs
-            log_plot_dict["logs"] = logs[log_key]
-            factor = 1
-            if "Success" in log_key or "Accuracy" in log_key:
-                factor = 100
-            max_value = False
-            report_values(log_key, logs[log_key], factor, max_value)
-            if log_prop["kwargs"]:
-                log_plot_dict.update(log_prop["kwargs"])
-            plot(**log_plot_dict)
+        render_figures(figures, render_workers)
+        print_color(
+            "Rendered {} figures in {:.2f}s, watching for changes ...".format(
+                len(figures), time.perf_counter() - start
+            ),
+            "yellow",
+        )
+
+    refresh(set(list_files()))
+    watch_files(list_files, refresh, interval, debounce)
+
+
+def render_figures(figures, workers=None):
+    """
+    plot(**figure) for every figure, on a pool of workers if workers > 1.
+    """
+    # matplotlib is only imported once there is something to draw
+    from toolbox.plot import plot
+
+    if workers is None or workers <= 1 or len(figures) <= 1:
+        _init_render_worker()
+        for figure in figures:
+            plot(**figure)
+        return
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(figures)), initializer=_init_render_worker
+    ) as executor:
+        futures = [executor.submit(plot, **figure) for figure in figures]
+        for future in futures:
+            future.result()
+
+
+def _init_render_worker():
+    import matplotlib
+
+    # figures are only saved to files
+    matplotlib.use("Agg")
+
+
+def print_timings(timings):
+    print_color("Timings", "blue")
+    for stage, duration in timings.items():
+        print("{:>10}: {:.2f}s".format(stage, duration))
+    print("{:>10}: {:.2f}s".format("total", sum(timings.values())))
+
+
+@click.command()
+@click.argument("experiment", type=str, required=True)
+@click.option(
+    "--stats-key", "-sk", type=str, default=None, help="aggregate seeds, eg /seed"
+)
+@click.option("--worker-key", type=str, default=None, help="average runs over workers")
+@click.option("--band", type=click.Choice(BANDS), default="minmax")
+@click.option("--workers", "-w", type=int, default=None)
+@click.option("--render-workers", type=int, default=os.cpu_count())
+@click.option("--dpi", type=int, default=300)
+@click.option("--cache-dir", type=str, default=None, help="scalar cache directory")
+@click.option("--clear-cache", is_flag=True, help="invalidate the scalar cache first")
+@click.option("--reader", type=click.Choice(READERS), default="accumulator")
+@click.option("--sampling", type=click.Choice(SAMPLERS), default="reservoir")
+@click.option("--num-scalars", type=int, default=1000, help="0 keeps every point")
+@click.option("--index", type=str, default=None, help="event file index database")
+@click.option("--watch", is_flag=True, help="re-render figures as event files grow")
+@click.option("--interval", type=float, default=10, help="--watch polling period")
+@click.option("--debounce", type=float, default=2, help="--watch quiet period")
+def main(
+    experiment,
+    stats_key,
+    worker_key,
+    band,
+    workers,
+    render_workers,
+    dpi,
+    cache_dir,
+    clear_cache,
+    reader,
+    sampling,
+    num_scalars,
+    index,
+    watch,
+    interval,
+    debounce,
+):
+    timings = {}
+    start = time.perf_counter()
+    if cache_dir is not None and clear_cache:
+        ScalarCache(cache_dir).invalidate()
+    plot_dict = yaml.load(
+        open(os.path.join(BASE_DIR, "experiments", "plot.yml"), "r"),
+        Loader=yaml.FullLoader,
+    )
+    exp_dict = yaml.load(
+        open(os.path.join(BASE_DIR, "experiments", experiment), "r"),
+        Loader=yaml.FullLoader,
+    )
+    savedir = plot_dict.pop("savedir")
+    plot_dict["dpi"] = dpi
+    log_keys = list(exp_dict["log_keys"].keys()) + ["trainer/epoch"]
+    if index is not None:
+        index = EventIndex(index)
+    entries = plan_report(exp_dict, index)
+    # entries sharing directories share their event files, loaded only once
+    files = list(dict.fromkeys(f for *_, log_files in entries for f, _ in log_files))
+    timings["plan"] = time.perf_counter() - start
+
+    if watch:
+        watch_report(
+            exp_dict,
+            plot_dict,
+            savedir,
+            log_keys,
+            stats_key,
+            worker_key,
+            num_scalars,
+            band,
+            sampling,
+            render_workers,
+            interval,
+            debounce,
+            index,
+        )
+        return
+
+    start = time.perf_counter()
+    print("Loading {} event files ...".format(len(files)))
+    files_logs = read_event_files(
+        files,
+        log_keys,
+        workers=workers,
+        cache_dir=cache_dir,
+        reader=reader,
+        sampling=sampling,
+        num_scalars=num_scalars,
+    )
+    loaded = dict(zip(files, files_logs))
+    timings["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    figures = []
+    for entry in entries:
+        figures += entry_figures(
+            entry,
+            [loaded[log_file] for log_file, _ in entry[3]],
+            exp_dict,
+            plot_dict,
+            savedir,
+            stats_key,
+            worker_key,
+            num_scalars,
+            band,
+        )
+    timings["aggregate"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    render_figures(figures, render_workers)
+    for plot_name, *_ in entries:
         print("Plots saved in {}/{}_*.png".format(savedir, plot_name))
+    timings["render"] = time.perf_counter() - start
+    print_timings(timings)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from toolbox.tfevents import read_scalars
+
+DEFAULT_MAX_BYTES = 2**30
+COLUMNS = ("steps", "timestamps", "values")
+
+
+class ScalarCache:
+    """
+    On-disk cache of the scalar columns of tfevents files.
+
+    Each event file gets one .npz entry holding every scalar tag, keyed on
+    the absolute path and validated against the file size and mtime. When an
+    event file has grown since it was cached, only the bytes appended after
+    the last complete record are parsed. Entries are evicted least recently
+    used first once the cache exceeds max_bytes. The cache keeps a running
+    total of the bytes it wrote, so the directory is only scanned by the
+    first eviction and when the total goes over max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # bytes of the entries, None until evict() has scanned the directory
+        self._total_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, path):
+        key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, path, evict=True):
+        """
+        Return {tag: {"steps", "timestamps", "values"}} for all the scalar
+        tags of the event file at path, reading as little of it as possible.
+        With evict=False, the caller evicts once after a batch of loads.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry_path = self.entry_path(path)
+        meta, scalars = self._read_entry(entry_path)
+
+        if meta is not None and meta["path"] == path:
+            if meta["size"] == stat.st_size and meta["mtime"] == stat.st_mtime_ns:
+                # touch the entry so that it counts as recently used
+                os.utime(entry_path)
+                return scalars
+            if meta["size"] < stat.st_size:
+                tail, offset = read_scalars(path, offset=meta["offset"])
+                scalars = _concat_scalars(scalars, tail)
+            else:
+                scalars, offset = read_scalars(path)
+        else:
+            scalars, offset = read_scalars(path)
+
+        meta = {
+            "path": path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "offset": offset,
+        }
+        old_size = _size(entry_path)
+        new_size = self._write_entry(entry_path, meta, scalars)
+        if self._total_bytes is not None:
+            self._total_bytes += new_size - old_size
+        if evict and (self._total_bytes is None or self._total_bytes > self.max_bytes):
+            self.evict()
+        return scalars
+
+    def invalidate(self, path=None):
+        """
+        Drop the entry of path, or every entry when path is None.
+        """
+        if path is not None:
+            entries = [self.entry_path(path)]
+        else:
+            entries = glob.glob(os.path.join(self.cache_dir, "*.npz"))
+        for entry in entries:
+            _remove(entry)
+        self._total_bytes = None
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        for entry in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+            try:
+                stat = os.stat(entry)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            _remove(entry)
+            total -= size
+        self._total_bytes = total
+
+    def _read_entry(self, entry_path):
+        try:
+            with np.load(entry_path) as entry:
+                meta = json.loads(str(entry["meta"]))
+                scalars = {}
+                for i, tag in enumerate(meta["tags"]):
+                    scalars[tag] = {k: entry[f"{k}_{i}"] for k in COLUMNS}
+        except Exception:
+            # missing, evicted by another process or corrupt: treat as a miss
+            return None, None
+        return meta, scalars
+
+    def _write_entry(self, entry_path, meta, scalars):
+        meta = dict(meta, tags=list(scalars.keys()))
+        arrays = {"meta": np.array(json.dumps(meta))}
+        for i, scalar in enumerate(scalars.values()):
+            for k in COLUMNS:
+                arrays[f"{k}_{i}"] = scalar[k]
+        # write then rename so that concurrent readers never see a partial entry
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+            size = f.tell()
+        os.replace(tmp_path, entry_path)
+        return size
+
+
+def _concat_scalars(scalars, tail):
+    scalars = dict(scalars)
+    for tag, scalar in tail.items():
+        if tag in scalars:
+            scalars[tag] = {
+                k: np.concatenate((scalars[tag][k], scalar[k])) for k in COLUMNS
+            }
+        else:
+            scalars[tag] = scalar
+    return scalars
+
+
+def _size(path):
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
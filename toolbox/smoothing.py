@@ -0,0 +1,159 @@
+import numpy as np
+
+KERNELS = ("ema", "debiased_ema", "window", "gaussian")
+# largest exponent of 1 / weight used inside an EMA block, far from overflow
+_MAX_EXPONENT = 200
+_MAX_BLOCK_SIZE = 1 << 16
+_GAUSSIAN_TRUNCATE = 4
+# longer kernels are applied by FFT, block by block
+_DIRECT_KERNEL_SIZE = 64
+
+
+def smooth(values, weight, kernel="ema"):
+    """
+    Smooth the columns of (N,) or (N, k) values along N. weight is the EMA
+    weight in [0, 1] for ema and debiased_ema, the window size in points for
+    window and the standard deviation in points for gaussian. Returns a new
+    float64 array; NaNs are skipped and stay NaN.
+    """
+    if kernel == "ema":
+        return ema(values, weight)
+    if kernel == "debiased_ema":
+        return ema(values, weight, debias=True)
+    if kernel == "window":
+        return moving_average(values, weight)
+    if kernel == "gaussian":
+        return gaussian_smooth(values, weight)
+    raise ValueError(f"kernel should be in {KERNELS}, got {kernel}")
+
+
+def ema(values, weight, debias=False):
+    """
+    Exponential moving average y[t] = weight * y[t - 1] + (1 - weight) * x[t].
+    Without debias y[-1] = x[0], the historical tensorboard smoothing; with
+    debias y[-1] = 0 and y[t] is divided by 1 - weight ** (t + 1), the
+    smoothing of current tensorboard versions.
+    """
+    if not 0 <= weight <= 1:
+        raise ValueError(f"EMA weight should be in [0, 1], got {weight}")
+    values, squeeze = _as_columns(values)
+    smoothed = _skip_nan(values, lambda x: _ema(x, weight, debias))
+    return smoothed[:, 0] if squeeze else smoothed
+
+
+def moving_average(values, window):
+    """
+    Mean over a centered window of window points, shrunk at the edges.
+    """
+    window = int(window)
+    if window < 1:
+        raise ValueError(f"window should be at least 1, got {window}")
+    return _convolve(values, np.ones(window))
+
+
+def gaussian_smooth(values, sigma):
+    """
+    Gaussian weighted mean, with weights renormalized at the edges.
+    """
+    if sigma <= 0:
+        return _convolve(values, np.ones(1))
+    radius = int(np.ceil(_GAUSSIAN_TRUNCATE * sigma))
+    x = np.arange(-radius, radius + 1)
+    return _convolve(values, np.exp(-0.5 * (x / sigma) ** 2))
+
+
+def _ema(x, weight, debias):
+    n = len(x)
+    smoothed = np.empty_like(x)
+    if n == 0 or weight == 0:
+        smoothed[:] = x
+        return smoothed
+    if weight == 1:
+        if debias:
+            # limit of the debiased average: the mean of the values so far
+            smoothed[:] = np.cumsum(x, axis=0) / np.arange(1, n + 1)[:, None]
+        else:
+            smoothed[:] = x[:1]
+        return smoothed
+
+    # closed form inside a block of size b starting after y[s - 1]:
+    # y[s + i] = weight ** (i + 1) * y[s - 1]
+    #            + (1 - weight) * weight ** i * cumsum(x[s + j] / weight ** j)
+    # blocks are small enough for 1 / weight ** j not to overflow
+    block_size = int(_MAX_EXPONENT / -np.log10(weight))
+    block_size = min(max(block_size, 1), _MAX_BLOCK_SIZE, n)
+    powers = weight ** np.arange(block_size + 1, dtype=np.float64)
+    inverse_powers = (1 / weight) ** np.arange(block_size, dtype=np.float64)
+    last = np.zeros(x.shape[1]) if debias else x[0].astype(np.float64)
+    for start in range(0, n, block_size):
+        block = x[start : start + block_size]
+        b = len(block)
+        terms = np.cumsum(block * inverse_powers[:b, None], axis=0)
+        out = smoothed[start : start + b]
+        np.multiply(terms, ((1 - weight) * powers[:b])[:, None], out=out)
+        out += powers[1 : b + 1, None] * last
+        last = out[-1].copy()
+    if debias:
+        smoothed /= (1 - weight ** np.arange(1, n + 1, dtype=np.float64))[:, None]
+    return smoothed
+
+
+def _convolve(values, kernel):
+    values, squeeze = _as_columns(values)
+    valid = ~np.isnan(values)
+    smoothed = np.empty_like(values)
+    # centered part of the full convolution, whatever the kernel length
+    center = slice((len(kernel) - 1) // 2, (len(kernel) - 1) // 2 + len(values))
+    for j in range(values.shape[1]):
+        # NaNs have no weight; weights are renormalized by the valid ones
+        column = np.where(valid[:, j], values[:, j], 0)
+        total = _full_convolve(column, kernel)[center]
+        weights = _full_convolve(valid[:, j].astype(np.float64), kernel)[center]
+        smoothed[:, j] = total / np.maximum(weights, np.finfo(np.float64).tiny)
+    smoothed[~valid] = np.nan
+    return smoothed[:, 0] if squeeze else smoothed
+
+
+def _full_convolve(x, kernel):
+    """
+    np.convolve(x, kernel), by overlap-add of FFT blocks for long kernels
+    so that the cost does not grow with len(x) * len(kernel).
+    """
+    k = len(kernel)
+    if k <= _DIRECT_KERNEL_SIZE:
+        return np.convolve(x, kernel)
+    size = 1 << int(np.ceil(np.log2(8 * k)))
+    step = size - k + 1
+    kernel_fft = np.fft.rfft(kernel, size)
+    out = np.zeros(len(x) + k - 1)
+    for start in range(0, len(x), step):
+        block = x[start : start + step]
+        block = np.fft.irfft(np.fft.rfft(block, size) * kernel_fft, size)
+        end = min(start + size, len(out))
+        out[start:end] += block[: end - start]
+    return out
+
+
+def _skip_nan(values, fn):
+    """
+    fn on the columns of values with their NaNs removed, NaNs put back after.
+    """
+    valid = ~np.isnan(values)
+    if valid.all():
+        return fn(values)
+    smoothed = np.full(values.shape, np.nan)
+    if (valid == valid[:, :1]).all():
+        rows = valid[:, 0]
+        smoothed[rows] = fn(values[rows])
+        return smoothed
+    for j in range(values.shape[1]):
+        rows = valid[:, j]
+        smoothed[rows, j] = fn(values[rows, j : j + 1])[:, 0]
+    return smoothed
+
+
+def _as_columns(values):
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        return values[:, None], True
+    return values, False
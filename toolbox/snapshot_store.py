@@ -0,0 +1,239 @@
+import copy
+import hashlib
+import io
+import json
+import os
+import os.path as osp
+import re
+
+import numpy as np
+
+# torch is imported by the methods using it, it takes seconds to import
+MANIFEST_FILE_NAME = re.compile(r"itr_(\d+)\.pkl")
+
+
+class BlobRef:
+    """
+    Placeholder of a tensor in a manifest: the key of its blob and what is
+    needed to rebuild it.
+    """
+
+    def __init__(self, key, dtype, shape, device, requires_grad, parameter):
+        self.key = key
+        self.dtype = dtype
+        self.shape = shape
+        self.device = device
+        self.requires_grad = requires_grad
+        self.parameter = parameter
+
+
+class SnapshotStore:
+    """
+    Snapshots stored once per tensor content.
+
+    Each tensor is written to blobs/ under the sha256 of its dtype, shape and
+    bytes, so tensors that do not change between iterations are stored once.
+    An iteration only writes a manifest, the params structure with tensors
+    replaced by BlobRef. refcounts.json counts the manifests using each blob;
+    a blob is deleted when its count drops to zero. Counts are raised before
+    a manifest is written and lowered after one is removed, so a crash can
+    only leave them too high, which gc() repairs, never delete a blob in use.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._blobs_dir = osp.join(root, "blobs")
+        self._manifests_dir = osp.join(root, "manifests")
+        self._refcounts_path = osp.join(root, "refcounts.json")
+        os.makedirs(self._blobs_dir, exist_ok=True)
+        os.makedirs(self._manifests_dir, exist_ok=True)
+        if osp.exists(self._refcounts_path):
+            with open(self._refcounts_path) as f:
+                self._refcounts = json.load(f)
+        else:
+            self._refcounts = self._count_refs()
+
+    def save(self, itr, params):
+        """
+        Write the blobs params needs that are not stored yet, their counts,
+        then its manifest.
+        """
+        import torch
+
+        keys = set()
+        structure = self._to_structure(params, keys, {})
+        manifest_path = self._manifest_path(itr)
+        old_keys = self._manifest_keys(itr) if osp.exists(manifest_path) else set()
+        for key in keys - old_keys:
+            self._refcounts[key] = self._refcounts.get(key, 0) + 1
+        self._write_refcounts()
+        buffer = io.BytesIO()
+        torch.save({"keys": sorted(keys), "params": structure}, buffer)
+        atomic_write(manifest_path, buffer.getbuffer())
+        self._release(old_keys - keys)
+
+    def load(self, itr, map_location=None):
+        """
+        Rebuild the params of iteration itr. Tensors go back to the device
+        they were saved from unless map_location names another one.
+        """
+        import torch
+
+        with open(self._manifest_path(itr), "rb") as f:
+            manifest = torch.load(f, map_location=map_location, weights_only=False)
+        return self._from_structure(manifest["params"], {}, map_location)
+
+    def remove(self, itr):
+        keys = self._manifest_keys(itr)
+        os.remove(self._manifest_path(itr))
+        self._release(keys)
+
+    def prune(self, keep_last):
+        """
+        Remove all but the keep_last most recent iterations.
+        """
+        itrs = self.itrs()
+        for itr in itrs[: max(len(itrs) - keep_last, 0)]:
+            self.remove(itr)
+
+    def itrs(self):
+        itrs = []
+        for file_name in os.listdir(self._manifests_dir):
+            match = MANIFEST_FILE_NAME.fullmatch(file_name)
+            if match:
+                itrs.append(int(match[1]))
+        return sorted(itrs)
+
+    def size(self):
+        """
+        Bytes used by the blobs.
+        """
+        return sum(osp.getsize(self._blob_path(key)) for key in self._refcounts)
+
+    def gc(self):
+        """
+        Recount the references from the manifests and delete unused blobs,
+        e.g. after a crash between writing counts and a manifest.
+        """
+        self._refcounts = self._count_refs()
+        for dir_name in os.listdir(self._blobs_dir):
+            for file_name in os.listdir(osp.join(self._blobs_dir, dir_name)):
+                if file_name[:-4] not in self._refcounts:
+                    os.remove(osp.join(self._blobs_dir, dir_name, file_name))
+        self._write_refcounts()
+
+    def _to_structure(self, params, keys, refs):
+        import torch
+
+        if isinstance(params, torch.Tensor):
+            # the same tensor twice, such as tied weights, gets the same ref
+            if id(params) not in refs:
+                refs[id(params)] = self._write_blob(params)
+                keys.add(refs[id(params)].key)
+            return refs[id(params)]
+        if isinstance(params, dict):
+            # shallow copy to keep the type and attributes of state dicts
+            structure = copy.copy(params)
+            for k, v in params.items():
+                structure[k] = self._to_structure(v, keys, refs)
+            return structure
+        if type(params) in (list, tuple):
+            return type(params)(self._to_structure(v, keys, refs) for v in params)
+        return params
+
+    def _from_structure(self, structure, tensors, map_location):
+        if isinstance(structure, BlobRef):
+            if id(structure) not in tensors:
+                tensors[id(structure)] = self._read_blob(structure, map_location)
+            return tensors[id(structure)]
+        if isinstance(structure, dict):
+            params = copy.copy(structure)
+            for k, v in structure.items():
+                params[k] = self._from_structure(v, tensors, map_location)
+            return params
+        if type(structure) in (list, tuple):
+            return type(structure)(
+                self._from_structure(v, tensors, map_location) for v in structure
+            )
+        return structure
+
+    def _write_blob(self, tensor):
+        import torch
+
+        data = tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8)
+        data = data.numpy()
+        digest = hashlib.sha256()
+        digest.update("{}:{}:".format(tensor.dtype, tuple(tensor.shape)).encode())
+        digest.update(data)
+        key = digest.hexdigest()
+        path = self._blob_path(key)
+        if not osp.exists(path):
+            os.makedirs(osp.dirname(path), exist_ok=True)
+            atomic_write(path, data)
+        return BlobRef(
+            key,
+            tensor.dtype,
+            tuple(tensor.shape),
+            str(tensor.device),
+            tensor.requires_grad,
+            isinstance(tensor, torch.nn.Parameter),
+        )
+
+    def _read_blob(self, ref, map_location):
+        import torch
+
+        data = np.fromfile(self._blob_path(ref.key), dtype=np.uint8)
+        tensor = torch.from_numpy(data).view(ref.dtype).reshape(ref.shape)
+        tensor = tensor.to(map_location or ref.device)
+        if ref.parameter:
+            return torch.nn.Parameter(tensor, requires_grad=ref.requires_grad)
+        return tensor.requires_grad_(ref.requires_grad)
+
+    def _release(self, keys):
+        unused = []
+        for key in keys:
+            self._refcounts[key] -= 1
+            if self._refcounts[key] <= 0:
+                del self._refcounts[key]
+                unused.append(key)
+        # counts first, a crash leaves unused blobs for gc() to delete
+        self._write_refcounts()
+        for key in unused:
+            os.remove(self._blob_path(key))
+
+    def _count_refs(self):
+        refcounts = {}
+        for itr in self.itrs():
+            for key in self._manifest_keys(itr):
+                refcounts[key] = refcounts.get(key, 0) + 1
+        return refcounts
+
+    def _manifest_keys(self, itr):
+        import torch
+
+        with open(self._manifest_path(itr), "rb") as f:
+            return set(torch.load(f, map_location="cpu", weights_only=False)["keys"])
+
+    def _write_refcounts(self):
+        atomic_write(
+            self._refcounts_path, json.dumps(self._refcounts, sort_keys=True).encode()
+        )
+
+    def _manifest_path(self, itr):
+        return osp.join(self._manifests_dir, "itr_{}.pkl".format(itr))
+
+    def _blob_path(self, key):
+        return osp.join(self._blobs_dir, key[:2], key + ".bin")
+
+
+def atomic_write(file_name, data):
+    """
+    Write data to a temporary file and rename it over file_name, so that a
+    crash mid-write leaves the previous file intact.
+    """
+    tmp_file_name = "{}.tmp.{}".format(file_name, os.getpid())
+    with open(tmp_file_name, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file_name, file_name)
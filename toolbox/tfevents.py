@@ -0,0 +1,335 @@
+import os
+import re
+import struct
+import time
+
+import click
+import numpy as np
+
+# TFRecord framing: uint64 length, uint32 masked crc of the length, payload,
+# uint32 masked crc of the payload
+_HEADER = struct.Struct("<QI")
+_HEADER_SIZE = _HEADER.size
+_FOOTER_SIZE = 4
+
+# protobuf wire types and the field numbers of event.proto / summary.proto
+_VARINT, _FIXED64, _LENGTH, _FIXED32 = 0, 1, 2, 5
+_DOUBLE = struct.Struct("<d")
+_FLOAT = struct.Struct("<f")
+_EVENT_WALL_TIME, _EVENT_STEP, _EVENT_SUMMARY = 1, 2, 5
+_SUMMARY_VALUE = 1
+_VALUE_TAG, _VALUE_SIMPLE_VALUE = 1, 2
+_VALUE_NON_SCALAR = {3, 4, 5, 6, 8}
+_TAG_PREFIX = bytes([_VALUE_TAG << 3 | _LENGTH])
+# the layout writers use for an Event holding a single short simple_value:
+# wall_time, step, summary { value { tag, simple_value } }
+_SIMPLE_SCALAR_EVENT = re.compile(
+    rb"\x09(.{8})\x10([\x80-\xff]{0,9}[\x00-\x7f])"
+    rb"\x2a[\x00-\x7f]\x0a[\x00-\x7f]\x0a([\x00-\x7f])(.*)\x15(.{4})",
+    re.DOTALL,
+)
+# framing plus the smallest Event holding a scalar, used to size the arrays
+_MIN_SCALAR_RECORD = 40
+_MAX_INITIAL_CAPACITY = 1 << 16
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+class CorruptRecordError(ValueError):
+    """
+    A complete record of an event file that is not a valid Event.
+    """
+
+
+def iter_records(f, offset=0):
+    """
+    Yield (end_offset, payload) for every complete record of an open event
+    file, starting at byte offset. Stops silently at a truncated record so
+    that a file still being written can be resumed from the last end_offset.
+    """
+    size = os.fstat(f.fileno()).st_size
+    f.seek(offset)
+    while True:
+        header = f.read(_HEADER_SIZE)
+        if len(header) < _HEADER_SIZE:
+            return
+        length, _ = _HEADER.unpack(header)
+        # a corrupt length must not make us allocate past the end of the file
+        if offset + _HEADER_SIZE + length + _FOOTER_SIZE > size:
+            return
+        data = f.read(length + _FOOTER_SIZE)
+        if len(data) < length + _FOOTER_SIZE:
+            return
+        offset += _HEADER_SIZE + length + _FOOTER_SIZE
+        yield offset, data[:length]
+
+
+def read_scalars(path, log_keys=None, offset=0):
+    """
+    Read the simple_value scalars of an event file from byte offset.
+    Returns ({tag: {"steps", "timestamps", "values"}}, end_offset) where
+    end_offset is the position right after the last complete record.
+    """
+    for end, scalars in iter_scalar_chunks(path, log_keys, offset, chunk_size=None):
+        pass
+    return scalars, end
+
+
+def iter_scalar_chunks(path, log_keys=None, offset=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield (end_offset, {tag: {"steps", "timestamps", "values"}}) every
+    chunk_size records, or once at the end of the file if chunk_size is None.
+    Chunk arrays are views on buffers that the next chunk overwrites.
+
+    Records are decoded by hand: a summary value whose tag is not in log_keys,
+    or which is not a simple_value, is skipped before its payload is decoded,
+    so histograms, images and unrequested tags cost a few byte comparisons.
+    """
+    if log_keys is not None:
+        log_keys = set(log_keys)
+        # a record can only hold a requested tag if its encoded tag field is in it
+        needles = re.compile(
+            b"|".join(
+                re.escape(_TAG_PREFIX + _encode_varint(len(k.encode())) + k.encode())
+                for k in log_keys
+            )
+        )
+    capacity = os.path.getsize(path) // _MIN_SCALAR_RECORD
+    capacity = min(max(capacity, 1), chunk_size or _MAX_INITIAL_CAPACITY)
+    columns = {}
+    end = offset
+    num_records = 0
+    with open(path, "rb") as f:
+        for record_end, record in iter_records(f, offset):
+            if chunk_size is not None and num_records == chunk_size:
+                yield end, _chunk_arrays(columns)
+                num_records = 0
+            end = record_end
+            num_records += 1
+            if log_keys is not None and needles.search(record) is None:
+                continue
+            try:
+                match = _SIMPLE_SCALAR_EVENT.fullmatch(record)
+                if match is not None and len(match[4]) == match[3][0]:
+                    scalars = _simple_scalar_event(match, log_keys)
+                else:
+                    scalars = parse_scalar_event(record, log_keys)
+            except (ValueError, IndexError, struct.error) as e:
+                raise CorruptRecordError(
+                    f"corrupt record ending at byte {record_end} of {path}: {e}"
+                ) from e
+            for tag, step, wall_time, value in scalars:
+                if tag not in columns:
+                    columns[tag] = ScalarColumns(capacity)
+                columns[tag].append(step, wall_time, value)
+    yield end, _chunk_arrays(columns)
+
+
+def _chunk_arrays(columns):
+    arrays = {tag: column.arrays() for tag, column in columns.items() if column.size}
+    for column in columns.values():
+        column.size = 0
+    return arrays
+
+
+class ScalarColumns:
+    """
+    Preallocated step, wall time and value arrays, grown geometrically.
+    """
+
+    def __init__(self, capacity=1024):
+        self.steps = np.empty(capacity, dtype=np.int64)
+        self.timestamps = np.empty(capacity, dtype=np.float64)
+        self.values = np.empty(capacity, dtype=np.float32)
+        self.size = 0
+
+    def append(self, step, wall_time, value):
+        if self.size == len(self.steps):
+            self._grow()
+        i = self.size
+        self.steps[i] = step
+        self.timestamps[i] = wall_time
+        self.values[i] = value
+        self.size = i + 1
+
+    def arrays(self):
+        n = self.size
+        return {
+            "steps": self.steps[:n],
+            "timestamps": self.timestamps[:n],
+            "values": self.values[:n],
+        }
+
+    def _grow(self):
+        capacity = 2 * len(self.steps)
+        for k in ("steps", "timestamps", "values"):
+            array = getattr(self, k)
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[: len(array)] = array
+            setattr(self, k, grown)
+
+
+def _simple_scalar_event(match, log_keys):
+    wall_time_bytes, step_bytes, _, tag_bytes, value_bytes = match.groups()
+    tag = tag_bytes.decode("utf-8")
+    if log_keys is not None and tag not in log_keys:
+        return []
+    step, _ = _read_varint(step_bytes, 0)
+    if step >= 1 << 63:
+        step -= 1 << 64
+    (wall_time,) = _DOUBLE.unpack(wall_time_bytes)
+    (value,) = _FLOAT.unpack(value_bytes)
+    return [(tag, step, wall_time, value)]
+
+
+def parse_scalar_event(record, log_keys=None):
+    """
+    Return [(tag, step, wall_time, value)] for the simple_value summaries of a
+    serialized Event, keeping only tags in log_keys when it is not None.
+    """
+    wall_time = 0.0
+    step = 0
+    summary = None
+    pos = 0
+    n = len(record)
+    while pos < n:
+        key = record[pos]
+        if key < 0x80:
+            pos += 1
+        else:
+            key, pos = _read_varint(record, pos)
+        field, wire_type = key >> 3, key & 7
+        if field == _EVENT_WALL_TIME and wire_type == _FIXED64:
+            (wall_time,) = _DOUBLE.unpack_from(record, pos)
+            pos += 8
+        elif field == _EVENT_STEP and wire_type == _VARINT:
+            step, pos = _read_varint(record, pos)
+            if step >= 1 << 63:
+                step -= 1 << 64
+        elif field == _EVENT_SUMMARY and wire_type == _LENGTH:
+            length, pos = _read_varint(record, pos)
+            summary = (pos, pos + length)
+            pos += length
+        else:
+            pos = _skip_field(record, pos, wire_type)
+    if summary is None:
+        return []
+
+    scalars = []
+    pos, summary_end = summary
+    while pos < summary_end:
+        key, pos = _read_varint(record, pos)
+        if key >> 3 != _SUMMARY_VALUE or key & 7 != _LENGTH:
+            pos = _skip_field(record, pos, key & 7)
+            continue
+        length, pos = _read_varint(record, pos)
+        value_end = pos + length
+        tag, value = _parse_value(record, pos, value_end, log_keys)
+        if value is not None:
+            scalars.append((tag, step, wall_time, value))
+        pos = value_end
+    return scalars
+
+
+def _parse_value(record, pos, end, log_keys):
+    tag = None
+    value = None
+    while pos < end:
+        key = record[pos]
+        if key < 0x80:
+            pos += 1
+        else:
+            key, pos = _read_varint(record, pos)
+        field, wire_type = key >> 3, key & 7
+        if field == _VALUE_TAG and wire_type == _LENGTH:
+            length = record[pos]
+            if length < 0x80:
+                pos += 1
+            else:
+                length, pos = _read_varint(record, pos)
+            tag = record[pos : pos + length].decode("utf-8")
+            pos += length
+            if log_keys is not None and tag not in log_keys:
+                return tag, None
+        elif field == _VALUE_SIMPLE_VALUE and wire_type == _FIXED32:
+            (value,) = _FLOAT.unpack_from(record, pos)
+            pos += 4
+        elif field in _VALUE_NON_SCALAR:
+            # histograms, images, audio, tensors: never decoded
+            return tag, None
+        else:
+            pos = _skip_field(record, pos, wire_type)
+    if tag is None:
+        return None, None
+    return tag, value
+
+
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _encode_varint(value):
+    out = bytearray()
+    while True:
+        b = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def _skip_field(buf, pos, wire_type):
+    if wire_type == _VARINT:
+        _, pos = _read_varint(buf, pos)
+        return pos
+    if wire_type == _FIXED64:
+        return pos + 8
+    if wire_type == _LENGTH:
+        length, pos = _read_varint(buf, pos)
+        return pos + length
+    if wire_type == _FIXED32:
+        return pos + 4
+    raise ValueError(f"unsupported protobuf wire type {wire_type}")
+
+
+@click.command(help="compare the native scalar reader with the EventAccumulator")
+@click.argument("paths", nargs=-1, type=str, required=True)
+@click.option("--key", "-k", "log_keys", type=str, multiple=True, required=True)
+@click.option("--repeat", "-r", type=int, default=3)
+def main(paths, log_keys, repeat):
+    from toolbox.logs_util import read_tensorboard
+
+    timings = {}
+    results = {}
+    for reader in ("accumulator", "native"):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results[reader] = read_tensorboard(paths, log_keys, reader=reader)
+            best = min(best, time.perf_counter() - start)
+        timings[reader] = best
+
+    same = results["accumulator"].keys() == results["native"].keys()
+    for log_key, runs in results["accumulator"].items():
+        native_runs = results["native"].get(log_key, {})
+        same = same and runs.keys() == native_runs.keys()
+        for name, log in runs.items():
+            for k, v in log.items():
+                same = same and np.array_equal(v, native_runs.get(name, {}).get(k))
+    for reader, timing in timings.items():
+        print("{}: {:.3f}s".format(reader, timing))
+    print("speedup: {:.1f}x".format(timings["accumulator"] / timings["native"]))
+    print("identical output: {}".format(same))
+
+
+if __name__ == "__main__":
+    main()
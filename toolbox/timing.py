@@ -0,0 +1,119 @@
+import contextlib
+import functools
+import time
+
+import numpy as np
+
+_NULL_SECTION = contextlib.nullcontext()
+
+
+class SectionTimer:
+    """
+    Wall times of the calls of a code section. The last capacity durations
+    are kept in a preallocated ring buffer for percentiles; count, total and
+    max cover every call.
+    """
+
+    __slots__ = ("name", "count", "total", "max", "_durations", "_starts")
+
+    def __init__(self, name, capacity=1024):
+        self.name = name
+        self._durations = np.empty(capacity)
+        self._starts = []
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self._durations[self.count % len(self._durations)] = duration
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def __enter__(self):
+        # a stack of starts, sections can be nested or recursive
+        self._starts.append(time.perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.add(time.perf_counter() - self._starts.pop())
+
+    def summary(self, percentiles=(50, 90, 99)):
+        durations = self._durations[: min(self.count, len(self._durations))]
+        summary = {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count,
+            "max": self.max,
+        }
+        for q, value in zip(percentiles, np.percentile(durations, percentiles)):
+            summary[f"p{q:g}"] = float(value)
+        return summary
+
+
+class Timings:
+    """
+    SectionTimers by name. When disabled, section() returns a shared no-op
+    context manager and timed functions are called directly.
+
+        timings = Timings(enabled=True)
+        with timings.section("env_step"):
+            env.step(action)
+
+        @timings.timed()
+        def update(batch):
+            ...
+    """
+
+    def __init__(self, enabled=False, capacity=1024, percentiles=(50, 90, 99)):
+        self.enabled = enabled
+        self.capacity = capacity
+        self.percentiles = tuple(percentiles)
+        self.timers = {}
+
+    def section(self, name):
+        if not self.enabled:
+            return _NULL_SECTION
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = SectionTimer(name, self.capacity)
+        return timer
+
+    def timed(self, name=None):
+        """
+        Decorator timing every call of a function as the section name, its
+        qualified name by default.
+        """
+
+        def decorator(fn):
+            section_name = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.section(section_name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def summary(self):
+        """
+        {section_name: {statistic: value}} of the sections called since the
+        last reset, durations in seconds.
+        """
+        return {
+            name: timer.summary(self.percentiles)
+            for name, timer in self.timers.items()
+            if timer.count > 0
+        }
+
+    def reset(self):
+        for timer in self.timers.values():
+            timer.reset()
@@ -1,7 +1,153 @@
-import skvideo
-skvideo.setFFmpegPath('/sequoia/data1/rstrudel/miniconda3/envs/bullet_cpu/bin/')
-import skvideo.io as skv
+import os
+import shutil
+import subprocess
+import tempfile
+
 import numpy as np
 
-def write_video(frames, path):
-    skv.vwrite(path, np.array(frames).astype(np.uint8))
+# same variable as imageio and moviepy
+FFMPEG_ENV = "FFMPEG_BINARY"
+
+
+def find_ffmpeg():
+    """
+    ffmpeg binary from $FFMPEG_BINARY, or found in the PATH.
+    """
+    ffmpeg = os.environ.get(FFMPEG_ENV) or shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise FileNotFoundError(
+            f"ffmpeg not found, install it or set ${FFMPEG_ENV} to its path"
+        )
+    return ffmpeg
+
+
+class VideoWriter:
+    """
+    Encode frames as they come by piping them to an ffmpeg process.
+
+    Frames are (height, width) or (height, width, 3) arrays, all of the size
+    of the first one; frames that are not uint8 are cast like
+    np.astype(np.uint8). Only one frame is held in memory at a time.
+
+        with VideoWriter("rollout.mp4", fps=30) as writer:
+            for frame in frames:
+                writer.write(frame)
+    """
+
+    def __init__(
+        self, path, fps=25, codec="libx264", pix_fmt="yuv420p", ffmpeg=None, args=()
+    ):
+        self.path = path
+        self.fps = fps
+        self.codec = codec
+        self.pix_fmt = pix_fmt
+        self.ffmpeg = ffmpeg
+        self.args = list(args)
+        self.num_frames = 0
+        self._shape = None
+        self._process = None
+        self._stderr = None
+        self._closed = False
+
+    def write(self, frame):
+        if self._closed:
+            raise RuntimeError(f"VideoWriter of {self.path} is closed")
+        frame = np.asarray(frame)
+        if frame.dtype != np.uint8:
+            frame = frame.astype(np.uint8)
+        if self._process is None:
+            self._open(frame.shape)
+        elif frame.shape != self._shape:
+            raise ValueError(
+                f"frame of shape {frame.shape}, the video has shape {self._shape}"
+            )
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            # ffmpeg exited, its error is more useful than the broken pipe
+            self._closed = True
+            returncode, error = self._wait()
+            raise RuntimeError(
+                f"ffmpeg stopped writing {self.path} (exit code {returncode}):\n"
+                f"{error}"
+            ) from None
+        self.num_frames += 1
+
+    def write_frames(self, frames):
+        """
+        Write every frame of an iterable, eg a generator of rollout frames.
+        """
+        for frame in frames:
+            self.write(frame)
+
+    def close(self):
+        self._closed = True
+        if self._process is None:
+            return
+        returncode, error = self._wait()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed writing {self.path}:\n{error}")
+
+    def _wait(self):
+        process, self._process = self._process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = process.wait()
+        self._stderr.seek(0)
+        error = self._stderr.read().decode(errors="replace")
+        self._stderr.close()
+        return returncode, error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _open(self, shape):
+        if len(shape) == 2:
+            pix_fmt = "gray"
+        elif len(shape) == 3 and shape[2] == 3:
+            pix_fmt = "rgb24"
+        else:
+            raise ValueError(f"frames should be (h, w) or (h, w, 3), got {shape}")
+        height, width = shape[:2]
+        command = [
+            self.ffmpeg or find_ffmpeg(),
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            pix_fmt,
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            str(self.fps),
+            "-i",
+            "-",
+            "-an",
+            "-vcodec",
+            self.codec,
+            "-pix_fmt",
+            self.pix_fmt,
+            # yuv420p needs even sizes
+            "-vf",
+            "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            *self.args,
+            self.path,
+        ]
+        # a file rather than a pipe, ffmpeg could block on a full stderr pipe
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stderr=self._stderr
+        )
+        self._shape = shape
+
+
+def write_video(frames, path, fps=25):
+    with VideoWriter(path, fps) as writer:
+        writer.write_frames(frames)
@@ -0,0 +1,47 @@
+import os
+import time
+
+
+def poll_files(files):
+    """
+    {file: (size, mtime)} of the files that still exist.
+    """
+    stats = {}
+    for path in files:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        stats[path] = (stat.st_size, stat.st_mtime_ns)
+    return stats
+
+
+def watch_files(list_files, on_change, interval=10, debounce=2, max_refreshes=None):
+    """
+    Poll the files returned by list_files() every interval seconds and call
+    on_change(changed) with the set of new, modified or removed files.
+
+    A burst of writes triggers a single call: once a change is seen, files
+    are polled every debounce seconds until they stop changing, or for at
+    most max(interval, debounce) seconds so that runs writing continuously
+    are still refreshed.
+    """
+    last = poll_files(list_files())
+    num_refreshes = 0
+    while max_refreshes is None or num_refreshes < max_refreshes:
+        time.sleep(interval)
+        current = poll_files(list_files())
+        if current == last:
+            continue
+        deadline = time.monotonic() + max(interval, debounce)
+        while time.monotonic() < deadline:
+            time.sleep(debounce)
+            settled = poll_files(list_files())
+            if settled == current:
+                break
+            current = settled
+        changed = {path for path, stat in current.items() if last.get(path) != stat}
+        changed |= set(last) - set(current)
+        last = current
+        on_change(changed)
+        num_refreshes += 1